@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from typing import List, Optional, Pattern
+import asyncio
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RoutePolicy:
+    """Concurrency budget for the group of routes whose path matches ``pattern``"""
+
+    def __init__(self, name: str, pattern: str, max_concurrency: int, max_queue: int,
+                 priority: int = 0):
+        self.name = name
+        self.pattern: Pattern = re.compile(pattern)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        # Higher priority routes keep being admitted until database latency
+        # reaches a larger multiple of the shedding threshold.
+        self.priority = priority
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+class AdmissionController:
+    """Bound in-flight work per route and shed load when the database slows down.
+
+    Database latency is tracked as an EWMA of a periodic ``ping`` so it reflects
+    Mongo health even when every handler is stuck waiting on it.
+    """
+
+    def __init__(self, db, policies: List[RoutePolicy],
+                 latency_threshold_ms: float = 250.0,
+                 max_queue_wait: float = 2.0,
+                 retry_after: int = 2,
+                 probe_interval: float = 1.0,
+                 serve_stale: bool = False,
+                 stale_cache_size: int = 256,
+                 stale_paths: Optional[List[str]] = None,
+                 exempt_paths: Optional[List[str]] = None):
+        self.db = db
+        self.policies = policies
+        self.latency_threshold_ms = latency_threshold_ms
+        self.max_queue_wait = max_queue_wait
+        self.retry_after = retry_after
+        self.probe_interval = probe_interval
+        self.serve_stale = serve_stale
+        self.stale_cache_size = stale_cache_size
+        # Only public reads matching these are recorded and served stale
+        self.stale_paths: List[Pattern] = [re.compile(pattern) for pattern in stale_paths or []]
+        self.exempt_paths = set(exempt_paths or [])
+        self.db_latency_ms = 0.0
+        self.stale_served = 0
+        self._stale = OrderedDict()
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    async def _probe_loop(self):
+        while True:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.db.command("ping"), timeout=self.max_queue_wait * 5)
+                sample = (time.perf_counter() - started) * 1000
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # An unreachable database is as overloaded as it gets.
+                sample = self.latency_threshold_ms * 10
+            self.observe_db_latency(sample)
+            await asyncio.sleep(self.probe_interval)
+
+    def observe_db_latency(self, latency_ms: float, alpha: float = 0.3):
+        self.db_latency_ms = alpha * latency_ms + (1 - alpha) * self.db_latency_ms
+
+    def policy_for(self, path: str) -> Optional[RoutePolicy]:
+        if path in self.exempt_paths:
+            return None
+        for policy in self.policies:
+            if policy.pattern.match(path):
+                return policy
+        return None
+
+    def should_shed(self, policy: RoutePolicy) -> bool:
+        if policy.queued >= policy.max_queue:
+            return True
+        return self.db_latency_ms > self.latency_threshold_ms * (1 + policy.priority)
+
+    async def acquire(self, policy: RoutePolicy) -> bool:
+        if self.should_shed(policy):
+            return False
+
+        policy.queued += 1
+        try:
+            await asyncio.wait_for(policy.semaphore.acquire(), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            policy.queued -= 1
+
+        policy.in_flight += 1
+        policy.admitted += 1
+        return True
+
+    def release(self, policy: RoutePolicy):
+        policy.in_flight -= 1
+        policy.semaphore.release()
+
+    def stale_key(self, scope) -> Optional[str]:
+        """Key a request's response is kept under for stale serving, or None
+        when it must never be cached: not a GET, not an allow-listed public
+        route, an admin route, or a request carrying admin credentials"""
+        path = scope["path"]
+        if scope["method"] != "GET" or path.startswith("/api/admin/"):
+            return None
+        if not any(pattern.match(path) for pattern in self.stale_paths):
+            return None
+        if any(name == b"x-admin-token" for name, _ in scope.get("headers", [])):
+            return None
+        return path + "?" + scope.get("query_string", b"").decode("latin-1")
+
+    def remember(self, key: str, headers: list, body: bytes):
+        self._stale[key] = (headers, body)
+        self._stale.move_to_end(key)
+        while len(self._stale) > self.stale_cache_size:
+            self._stale.popitem(last=False)
+
+    def stale_response(self, key: str):
+        return self._stale.get(key) if self.serve_stale else None
+
+    def snapshot(self) -> dict:
+        return {
+            "db_latency_ms": round(self.db_latency_ms, 2),
+            "latency_threshold_ms": self.latency_threshold_ms,
+            "stale_served": self.stale_served,
+            "routes": {policy.name: policy.snapshot() for policy in self.policies},
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to every HTTP request"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        policy = controller.policy_for(scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        cache_key = controller.stale_key(scope)
+
+        if not await controller.acquire(policy):
+            policy.shed += 1
+            await self._shed(cache_key, send)
+            return
+
+        try:
+            if cache_key is not None and controller.serve_stale:
+                await self.app(scope, receive, self._recording_send(cache_key, send))
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            controller.release(policy)
+
+    def _recording_send(self, cache_key: str, send):
+        controller = self.controller
+        state = {"status": None, "headers": [], "chunks": []}
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["headers"] = message.get("headers", [])
+            elif message["type"] == "http.response.body" and state["status"] == 200:
+                state["chunks"].append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    controller.remember(cache_key, state["headers"], b"".join(state["chunks"]))
+            await send(message)
+
+        return recording_send
+
+    async def _shed(self, cache_key: Optional[str], send):
+        controller = self.controller
+        stale = controller.stale_response(cache_key) if cache_key else None
+
+        if stale is not None:
+            headers, body = stale
+            controller.stale_served += 1
+            headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+            headers += [
+                (b"content-length", str(len(body)).encode()),
+                (b"warning", b'110 - "Response is Stale"'),
+            ]
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        body = json.dumps({"detail": "Service overloaded, please retry"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(controller.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
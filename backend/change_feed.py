@@ -0,0 +1,255 @@
+from pymongo.errors import OperationFailure, PyMongoError
+from typing import Callable, List, Optional, Set
+from datetime import datetime, timedelta
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Error codes returned when change streams are not supported by the deployment
+# (standalone server, or a storage engine/topology without an oplog).
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324, 136}
+
+
+class ChangeFeed:
+    """Tail writes to the movies collection and fan them out to local listeners.
+
+    Uses a Mongo change stream when the deployment supports it and falls back to
+    polling ``updated_at`` otherwise. Every event is a plain dict:
+
+        {"op": "insert" | "update" | "replace" | "delete" | "reset",
+         "id": <movie id or None>, "movie": <full document or None>}
+
+    A ``reset`` event tells listeners that changes were missed and any derived
+    state should be rebuilt from scratch.
+    """
+
+    STATE_ID = "movies_change_feed"
+
+    def __init__(self, movie_db, mode: str = "auto", poll_interval: float = 2.0,
+                 subscriber_queue_size: int = 100, token_save_every: int = 100,
+                 token_save_interval: float = 5.0, ignore_fields: Optional[Set[str]] = None,
+                 poll_overlap: float = 5.0):
+        self.movie_db = movie_db
+        self.movies = movie_db.movies
+        self.state = movie_db.db.change_feed_state
+        self.mode = mode
+        self.poll_interval = poll_interval
+        # updated_at is stamped before a write commits (write-behind flushes
+        # later still), so a poll also re-reads this many seconds behind the
+        # newest change seen, to catch writes that committed out of order
+        self.poll_overlap = timedelta(seconds=poll_overlap)
+        self.subscriber_queue_size = subscriber_queue_size
+        # The resume token is saved every ``token_save_every`` events or
+        # ``token_save_interval`` seconds, whichever comes first; after a
+        # restart at most that many (idempotent) events are replayed
+        self.token_save_every = token_save_every
+        self.token_save_interval = token_save_interval
+        # Updates that change nothing but these fields are not published
+        self.ignore_fields = set(ignore_fields or ())
+        self.ignored = 0
+        self.active_mode: Optional[str] = None
+        self._listeners: List[Callable] = []
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        # Change stream delete events only carry ``_id``. This map resolves
+        # the public id; it is loaded when the stream opens (pre-images would
+        # need MongoDB 6 with them enabled on the collection) and kept current
+        # from events.
+        self._oid_to_id = {}
+
+    def add_listener(self, listener: Callable):
+        """Register a callable (sync or async) invoked with every event"""
+        self._listeners.append(listener)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Create a queue that receives every event, used by SSE clients"""
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self.mode in ("auto", "stream"):
+                    try:
+                        await self._tail_change_stream()
+                    except OperationFailure as e:
+                        if self.mode == "stream" or e.code not in CHANGE_STREAM_UNSUPPORTED_CODES:
+                            raise
+                        logger.info("Change streams unavailable, falling back to polling updated_at")
+                        self.mode = "poll"
+                if self.mode == "poll":
+                    await self._poll_updated_at()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"Change feed interrupted: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _load_state(self) -> dict:
+        return await self.state.find_one({"_id": self.STATE_ID}) or {}
+
+    async def _load_ids(self) -> dict:
+        return {movie["_id"]: movie.get("id") async for movie in self.movies.find({}, {"id": 1})}
+
+    async def _save_state(self, **fields):
+        await self.state.update_one({"_id": self.STATE_ID}, {"$set": fields}, upsert=True)
+
+    async def _tail_change_stream(self):
+        state = await self._load_state()
+        resume_token = state.get("resume_token")
+        self.active_mode = "stream"
+
+        try:
+            stream = self.movies.watch(full_document="updateLookup", resume_after=resume_token)
+            async with stream:
+                # Loaded after the stream opens, so a movie inserted in
+                # between is seen by one or the other
+                self._oid_to_id = await self._load_ids()
+                unsaved = 0
+                last_saved = time.monotonic()
+                try:
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            await self._handle_change(change)
+                            unsaved += 1
+                        if unsaved and (unsaved >= self.token_save_every
+                                        or time.monotonic() - last_saved >= self.token_save_interval):
+                            await self._save_state(resume_token=stream.resume_token)
+                            unsaved = 0
+                            last_saved = time.monotonic()
+                finally:
+                    if unsaved:
+                        await self._save_state(resume_token=stream.resume_token)
+        except OperationFailure as e:
+            # The stored token fell off the oplog: start from now and tell
+            # listeners to rebuild, since we cannot replay what was missed.
+            if resume_token is not None and e.code == 286:
+                logger.warning("Change stream resume token expired, resetting listeners")
+                await self._save_state(resume_token=None)
+                await self._publish({"op": "reset", "id": None, "movie": None})
+                return
+            raise
+
+    async def _handle_change(self, change: dict):
+        op = change.get("operationType")
+        oid = change.get("documentKey", {}).get("_id")
+
+        if op in ("insert", "update", "replace"):
+            if op == "update" and self._only_ignored_fields(change):
+                self.ignored += 1
+                return
+            movie = change.get("fullDocument")
+            if movie is None:
+                return
+            self._oid_to_id[oid] = movie.get("id")
+            await self._publish({"op": op, "id": movie.get("id"), "movie": movie})
+        elif op == "delete":
+            await self._publish({"op": "delete", "id": self._oid_to_id.pop(oid, None), "movie": None})
+        elif op in ("drop", "rename", "dropDatabase", "invalidate"):
+            await self._publish({"op": "reset", "id": None, "movie": None})
+
+    def _only_ignored_fields(self, change: dict) -> bool:
+        description = change.get("updateDescription")
+        if not self.ignore_fields or not description:
+            return False
+        changed = set(description.get("updatedFields", {})) | set(description.get("removedFields", []))
+        return bool(changed) and changed <= self.ignore_fields
+
+    async def _poll_updated_at(self):
+        state = await self._load_state()
+        since = state.get("last_updated_at") or datetime.utcnow()
+        self._oid_to_id = await self._load_ids()
+        self.active_mode = "poll"
+
+        # (id, updated_at) of changes published within the overlap window
+        published = set()
+        while self.mode == "poll":
+            saved_since = since
+            cursor = self.movies.find({"updated_at": {"$gt": since - self.poll_overlap}}).sort("updated_at", 1)
+            async for movie in cursor:
+                self._oid_to_id[movie.get("_id")] = movie.get("id")
+                key = (movie.get("id"), movie["updated_at"])
+                if key in published:
+                    continue
+                published.add(key)
+                since = max(since, movie["updated_at"])
+                await self._publish({"op": "update", "id": movie.get("id"), "movie": movie})
+            if since != saved_since:
+                await self._save_state(last_updated_at=since)
+                published = {key for key in published if key[1] > since - self.poll_overlap}
+
+            # Hard deletes leave no trace in updated_at. When the collection
+            # holds fewer movies than have been seen, diff the ids to find
+            # which ones went away.
+            if await self.movies.count_documents({}) < len(self._oid_to_id):
+                current = await self._load_ids()
+                for oid, movie_id in self._oid_to_id.items():
+                    if oid not in current:
+                        await self._publish({"op": "delete", "id": movie_id, "movie": None})
+                self._oid_to_id = current
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def _publish(self, event: dict):
+        for listener in self._listeners:
+            try:
+                result = listener(event)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Change feed listener failed: {str(e)}")
+
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: drop it rather than let it hold memory forever.
+                # The None sentinel ends its stream so EventSource reconnects.
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def snapshot(self) -> dict:
+        return {
+            "mode": self.active_mode,
+            "listeners": len(self._listeners),
+            "subscribers": len(self._subscribers),
+            "ignored_updates": self.ignored,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+def format_sse(event: dict) -> str:
+    """Render a change feed event as a Server-Sent Events frame"""
+    movie = event.get("movie")
+    if movie is not None:
+        movie = {k: v for k, v in movie.items() if k != "_id"}
+    payload = {"op": event["op"], "id": event.get("id"), "movie": movie}
+    return f"event: {event['op']}\ndata: {json.dumps(payload, default=_json_default)}\n\n"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
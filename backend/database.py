@@ -1,28 +1,133 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import List, Optional
+from pymongo import ReturnDocument
+from typing import Callable, List, Optional, Tuple
+from contextlib import asynccontextmanager
+import inspect
+import logging
 import os
-from datetime import datetime
+import re
+import time
+from datetime import datetime, timedelta
 import uuid
 
+from models import parse_runtime_minutes
+from migrations import CURRENT_SCHEMA_VERSION
+from ratings import WEIGHTED_RATING_EXPR, weighted_rating
+
+
+class PreconditionFailed(Exception):
+    """Raised when a conditional write finds the movie at a different version"""
+
+
+def utc_now() -> datetime:
+    """Current UTC time truncated to the millisecond precision BSON stores, so
+    timestamps returned from a write match what a later read sees"""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
 class MovieDatabase:
+    # Index specs as (keys, options); compared against index_information() so
+    # existing indexes are never rebuilt on boot
+    INDEXES = [
+        ([("title", 1)], {}),
+        ([("genre", 1)], {}),
+        ([("rating", 1)], {}),
+        ([("year", 1)], {}),
+        ([("featured", 1)], {}),
+        ([("runtime_minutes", 1)], {}),
+        ([("genre", 1), ("runtime_minutes", 1)], {}),
+        ([("weighted_rating", 1)], {}),
+        ([("genre", 1), ("weighted_rating", 1)], {}),
+        # Popular sorts on vote_count then rating_field, whichever it is
+        ([("vote_count", 1), ("weighted_rating", 1)], {}),
+        ([("vote_count", 1), ("rating", 1)], {}),
+    ]
+
+    # sortBy values accepted by get_all_movies and the fields they sort on;
+    # rating sorts on rating_field
+    SORT_FIELDS = {"rating": "rating", "year": "year", "title": "title", "runtime": "runtime_minutes"}
+
     def __init__(self, mongo_url: str, db_name: str):
         self.client = AsyncIOMotorClient(mongo_url)
         self.db = self.client[db_name]
         self.movies = self.db.movies
+        self.search_results = self.db.search_results
+        self._write_listeners: List[Callable] = []
+        self._query_observers: List[Callable] = []
+        # Field behind rating sorts. Movies get weighted_rating from schema
+        # migration 3; until it has run, sorting on it would drop every
+        # legacy movie to the bottom, so the editorial rating is used
+        self.rating_field = "rating"
+
+    def add_query_observer(self, observer: Callable):
+        """Register a callable invoked after every read query as
+        ``observer(op, spec, started_at, duration_ms, returned)``"""
+        self._query_observers.append(observer)
+
+    @asynccontextmanager
+    async def _observe(self, op: str, collection: Optional[str] = None, **spec):
+        """Time a query; the caller stores the result size in ``observed["returned"]``.
+        Observers get the collection queried in ``spec["collection"]``"""
+        observed = {"returned": None}
+        if not self._query_observers:
+            yield observed
+            return
+        spec["collection"] = collection or self.movies.name
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            yield observed
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            for observer in self._query_observers:
+                try:
+                    observer(op, spec, started_at, duration_ms, observed["returned"])
+                except Exception as e:
+                    logging.error(f"Query observer failed for {op}: {str(e)}")
+
+    def add_write_listener(self, listener: Callable):
+        """Register a callable (sync or async) invoked after every write made
+        through this instance as ``listener(op, movie_id, before, after)``"""
+        self._write_listeners.append(listener)
 
-    async def create_indexes(self):
-        """Create indexes for better query performance"""
-        await self.movies.create_index("title")
-        await self.movies.create_index("genre")
-        await self.movies.create_index("rating")
-        await self.movies.create_index("year")
-        await self.movies.create_index("featured")
+    async def notify_write(self, op: str, movie_id: str,
+                            before: Optional[dict], after: Optional[dict]):
+        for listener in self._write_listeners:
+            try:
+                result = listener(op, movie_id, before, after)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logging.error(f"Write listener failed for {op} {movie_id}: {str(e)}")
+
+    async def missing_indexes(self) -> List[tuple]:
+        """Return the index specs that do not exist on the collection yet"""
+        existing = await self.movies.index_information()
+        existing_keys = [[tuple(k) for k in info["key"]] for info in existing.values()]
+        return [
+            (keys, options) for keys, options in self.INDEXES
+            if [tuple(k) for k in keys] not in existing_keys
+        ]
+
+    async def create_indexes(self, on_progress=None):
+        """Create missing indexes for better query performance"""
+        missing = await self.missing_indexes()
+        for built, (keys, options) in enumerate(missing, start=1):
+            await self.movies.create_index(keys, **options)
+            logging.info(f"Built index {keys}")
+            if on_progress:
+                on_progress(built, len(missing))
+        return len(missing)
 
     async def get_all_movies(self, 
                            genre: Optional[str] = None,
                            sort_by: str = "rating",
                            page: int = 1,
-                           limit: int = 20) -> tuple:
+                           limit: int = 20,
+                           min_runtime: Optional[int] = None,
+                           max_runtime: Optional[int] = None) -> tuple:
         """Get all movies with optional filtering and pagination"""
         skip = (page - 1) * limit
         
@@ -30,81 +135,288 @@ class MovieDatabase:
         query = {}
         if genre and genre != "all":
             query["genre"] = genre
+        if min_runtime is not None or max_runtime is not None:
+            query["runtime_minutes"] = {}
+            if min_runtime is not None:
+                query["runtime_minutes"]["$gte"] = min_runtime
+            if max_runtime is not None:
+                query["runtime_minutes"]["$lte"] = max_runtime
         
         # Build sort
-        sort_field = sort_by
+        sort_field = self.SORT_FIELDS.get(sort_by, sort_by)
+        if sort_by == "rating":
+            sort_field = self.rating_field
         sort_direction = -1  # Descending by default
         if sort_by == "title":
             sort_direction = 1  # Ascending for title
         
         # Get total count
-        total = await self.movies.count_documents(query)
+        async with self._observe("count", filter=query) as observed:
+            total = await self.movies.count_documents(query)
+            observed["returned"] = 1
         
         # Get movies
-        cursor = self.movies.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit)
-        movies = await cursor.to_list(length=limit)
+        async with self._observe("find", filter=query, sort={sort_field: sort_direction},
+                                 skip=skip, limit=limit) as observed:
+            cursor = self.movies.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit)
+            movies = await cursor.to_list(length=limit)
+            observed["returned"] = len(movies)
         
         return movies, total
 
     async def get_movie_by_id(self, movie_id: str):
         """Get a single movie by ID"""
-        return await self.movies.find_one({"id": movie_id})
-
-    async def search_movies(self, query: str) -> List[dict]:
-        """Search movies by title, director, or genre"""
-        search_regex = {"$regex": query, "$options": "i"}
-        search_query = {
-            "$or": [
-                {"title": search_regex},
-                {"director": search_regex},
-                {"genre": search_regex}
-            ]
+        async with self._observe("find", filter={"id": movie_id}, limit=1) as observed:
+            movie = await self.movies.find_one({"id": movie_id})
+            observed["returned"] = int(movie is not None)
+        return movie
+
+    # Relevance weight of a match in each field
+    SEARCH_WEIGHTS = {"title": 3, "director": 2, "genre": 1}
+
+    @staticmethod
+    def search_filter(query: str) -> dict:
+        """Case-insensitive substring match on title, director, or genre"""
+        search_regex = {"$regex": re.escape(query), "$options": "i"}
+        return {"$or": [{field: search_regex} for field in MovieDatabase.SEARCH_WEIGHTS]}
+
+    def _search_pipeline(self, query: str) -> List[dict]:
+        """Match stages shared by every search query, adding ``score`` and
+        ``rank`` (weighted rating, falling back to the editorial rating for
+        movies not yet migrated) to each match"""
+        pattern = re.escape(query)
+        matches = {
+            "title": {"$regexMatch": {"input": {"$ifNull": ["$title", ""]}, "regex": pattern, "options": "i"}},
+            "director": {"$regexMatch": {"input": {"$ifNull": ["$director", ""]}, "regex": pattern, "options": "i"}},
+            "genre": {"$gt": [{"$size": {"$filter": {
+                "input": {"$ifNull": ["$genre", []]}, "as": "g",
+                "cond": {"$regexMatch": {"input": "$$g", "regex": pattern, "options": "i"}}
+            }}}, 0]},
         }
-        
-        cursor = self.movies.find(search_query).sort("rating", -1)
-        return await cursor.to_list(length=50)
+        score = {"$add": [{"$cond": [matches[field], weight, 0]}
+                          for field, weight in self.SEARCH_WEIGHTS.items()]}
+        return [
+            {"$match": self.search_filter(query)},
+            {"$addFields": {"score": score, "rank": {"$ifNull": ["$weighted_rating", "$rating"]}}},
+        ]
+
+    # Search results order: most relevant, then best rated, then id
+    SEARCH_SORT = {"score": -1, "rank": -1, "id": 1}
+
+    async def search_candidates(self, query: str, cap: int) -> List[dict]:
+        """Sort keys ``{id, score, rank}`` of up to ``cap + 1`` matches, best
+        first. This is the one full match of a search; later pages read from
+        the stored keys (save_search_results) instead of matching again."""
+        pipeline = self._search_pipeline(query) + [
+            {"$sort": self.SEARCH_SORT},
+            {"$limit": cap + 1},
+            {"$project": {"_id": 0, "id": 1, "score": 1, "rank": 1}},
+        ]
+        async with self._observe("aggregate", pipeline=pipeline) as observed:
+            keys = await self.movies.aggregate(pipeline).to_list(length=cap + 1)
+            observed["returned"] = len(keys)
+        return keys
 
-    async def get_featured_movies(self) -> List[dict]:
+    async def search_movies(self, query: str, limit: int = 20,
+                            after: Optional[tuple] = None) -> Tuple[List[dict], bool]:
+        """Search movies by title, director, or genre, seeking past ``after``.
+
+        Used once the stored candidates of a search have expired or run out
+        (past the count cap). ``after`` is the (score, rank, id) of the last
+        movie returned; seeking saves the skip, but the regex match itself
+        runs again over the whole collection. Returns the page, each movie
+        carrying its ``score`` and ``rank``, and whether more results follow.
+        """
+        pipeline = self._search_pipeline(query)
+        if after is not None:
+            after_score, after_rank, after_id = after
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": after_score}},
+                {"score": after_score, "rank": {"$lt": after_rank}},
+                {"score": after_score, "rank": after_rank, "id": {"$gt": after_id}},
+            ]}})
+        pipeline += [{"$sort": self.SEARCH_SORT}, {"$limit": limit + 1}]
+
+        async with self._observe("aggregate", pipeline=pipeline) as observed:
+            movies = await self.movies.aggregate(pipeline).to_list(length=limit + 1)
+            observed["returned"] = len(movies)
+        return movies[:limit], len(movies) > limit
+
+    async def save_search_results(self, query: str, keys: List[dict]) -> str:
+        """Store a search's ordered sort keys for its later pages"""
+        result_id = uuid.uuid4().hex
+        async with self._observe("insert", collection=self.search_results.name) as observed:
+            await self.search_results.insert_one({
+                "_id": result_id, "q": query, "keys": keys, "created_at": utc_now()
+            })
+            observed["returned"] = 1
+        return result_id
+
+    async def load_search_results(self, result_id: str, offset: int, limit: int,
+                                  max_age_seconds: float) -> Optional[List[dict]]:
+        """One page of stored sort keys, or None once the results expired"""
+        oldest = utc_now() - timedelta(seconds=max_age_seconds)
+        query = {"_id": result_id, "created_at": {"$gt": oldest}}
+        async with self._observe("find", collection=self.search_results.name, filter=query,
+                                 limit=1) as observed:
+            doc = await self.search_results.find_one(
+                query,
+                {"keys": {"$slice": [offset, limit]}}
+            )
+            observed["returned"] = 1 if doc else 0
+        return doc["keys"] if doc else None
+
+    async def ensure_search_results_ttl(self, ttl_seconds: int):
+        """Let Mongo expire stored search results (reads check the age too)"""
+        await self.search_results.create_index("created_at", expireAfterSeconds=ttl_seconds)
+
+    async def get_movies_by_ids(self, movie_ids: List[str]) -> List[dict]:
+        """Movies for ``movie_ids`` in that order; ids with no movie are skipped"""
+        query = {"id": {"$in": movie_ids}}
+        async with self._observe("find", filter=query) as observed:
+            movies = await self.movies.find(query).to_list(length=len(movie_ids))
+            observed["returned"] = len(movies)
+        by_id = {movie["id"]: movie for movie in movies}
+        return [by_id[movie_id] for movie_id in movie_ids if movie_id in by_id]
+
+    async def get_featured_movies(self, limit: int = 10) -> List[dict]:
         """Get featured movies"""
-        cursor = self.movies.find({"featured": True}).sort("rating", -1)
-        return await cursor.to_list(length=10)
+        async with self._observe("find", filter={"featured": True}, sort={"rating": -1}, limit=limit) as observed:
+            cursor = self.movies.find({"featured": True}).sort("rating", -1).limit(limit)
+            movies = await cursor.to_list(length=limit)
+            observed["returned"] = len(movies)
+        return movies
 
     async def get_top_rated_movies(self, limit: int = 20) -> List[dict]:
-        """Get top rated movies"""
-        cursor = self.movies.find({}).sort("rating", -1).limit(limit)
-        return await cursor.to_list(length=limit)
+        """Get top rated movies by weighted rating"""
+        async with self._observe("find", filter={}, sort={self.rating_field: -1}, limit=limit) as observed:
+            cursor = self.movies.find({}).sort(self.rating_field, -1).limit(limit)
+            movies = await cursor.to_list(length=limit)
+            observed["returned"] = len(movies)
+        return movies
+
+    async def get_popular_movies(self, limit: int = 20) -> List[dict]:
+        """Get the most voted movies, ties broken by rating"""
+        sort = [("vote_count", -1), (self.rating_field, -1)]
+        async with self._observe("find", filter={}, sort=dict(sort), limit=limit) as observed:
+            cursor = self.movies.find({}).sort(sort).limit(limit)
+            movies = await cursor.to_list(length=limit)
+            observed["returned"] = len(movies)
+        return movies
 
     async def get_movies_by_genre(self, genre: str) -> List[dict]:
         """Get movies by specific genre"""
-        cursor = self.movies.find({"genre": genre}).sort("rating", -1)
-        return await cursor.to_list(length=50)
+        async with self._observe("find", filter={"genre": genre}, sort={"rating": -1}, limit=50) as observed:
+            cursor = self.movies.find({"genre": genre}).sort("rating", -1)
+            movies = await cursor.to_list(length=50)
+            observed["returned"] = len(movies)
+        return movies
+
+    async def get_movies_for_index(self, fields: List[str]) -> List[dict]:
+        """Get every movie projected to ``fields``, for building in-memory indexes"""
+        projection = {field: 1 for field in fields}
+        projection["_id"] = 0
+        async with self._observe("find", filter={}) as observed:
+            movies = await self.movies.find({}, projection).to_list(length=None)
+            observed["returned"] = len(movies)
+        return movies
+
+    @staticmethod
+    def prepare_new_movie(movie_data: dict) -> dict:
+        """Assign the id and timestamps of a movie about to be inserted"""
+        movie_data["id"] = str(uuid.uuid4())
+        movie_data["created_at"] = movie_data["updated_at"] = utc_now()
+        movie_data["runtime_minutes"] = parse_runtime_minutes(movie_data.get("duration"))
+        movie_data["vote_count"] = movie_data["vote_sum"] = 0
+        movie_data["weighted_rating"] = movie_data.get("rating")
+        movie_data["schema_version"] = CURRENT_SCHEMA_VERSION
+        return movie_data
+
+    @staticmethod
+    def prepare_update(update_data: dict) -> dict:
+        """Stamp updated_at and keep derived fields in step with their sources"""
+        update_data["updated_at"] = utc_now()
+        if "duration" in update_data:
+            update_data["runtime_minutes"] = parse_runtime_minutes(update_data["duration"])
+        return update_data
+
+    @staticmethod
+    def update_document(update_data: dict):
+        """Update for prepared ``update_data``; a rating change is a pipeline
+        update so weighted_rating is recomputed from the stored votes in the
+        same write"""
+        if "rating" not in update_data:
+            return {"$set": update_data}
+        return [
+            {"$set": {field: {"$literal": value} for field, value in update_data.items()}},
+            {"$set": {"weighted_rating": WEIGHTED_RATING_EXPR}},
+        ]
+
+    @staticmethod
+    def apply_update(before: dict, update_data: dict) -> dict:
+        """The document update_document(update_data) turns ``before`` into"""
+        after = {**before, **update_data}
+        if "rating" in update_data:
+            after["weighted_rating"] = weighted_rating(
+                after["rating"], after.get("vote_count", 0), after.get("vote_sum", 0))
+        return after
 
     async def create_movie(self, movie_data: dict):
         """Create a new movie"""
-        movie_data["id"] = str(uuid.uuid4())
-        movie_data["created_at"] = datetime.utcnow()
-        movie_data["updated_at"] = datetime.utcnow()
+        self.prepare_new_movie(movie_data)
         
-        result = await self.movies.insert_one(movie_data)
-        return await self.movies.find_one({"_id": result.inserted_id})
+        # insert_one adds the generated _id to movie_data, which is then
+        # exactly the stored document; no need to read it back
+        await self.movies.insert_one(movie_data)
+        await self.notify_write("insert", movie_data["id"], None, movie_data)
+        return movie_data
+
+    @staticmethod
+    def _version_filter(movie_id: str, expected_updated_at: Optional[datetime]) -> dict:
+        query = {"id": movie_id}
+        if expected_updated_at is not None:
+            query["updated_at"] = expected_updated_at
+        return query
+
+    async def _check_precondition(self, movie_id: str, expected_updated_at: Optional[datetime]):
+        """After a conditional write matched nothing, tell a missing movie
+        (return normally) from a stale version (raise PreconditionFailed)"""
+        if expected_updated_at is not None and await self.movies.count_documents({"id": movie_id}, limit=1):
+            raise PreconditionFailed(movie_id)
 
-    async def update_movie(self, movie_id: str, update_data: dict):
-        """Update a movie"""
-        update_data["updated_at"] = datetime.utcnow()
+    async def update_movie(self, movie_id: str, update_data: dict,
+                           expected_updated_at: Optional[datetime] = None):
+        """Update a movie, optionally only if it is still at ``expected_updated_at``"""
+        self.prepare_update(update_data)
         
-        result = await self.movies.update_one(
-            {"id": movie_id},
-            {"$set": update_data}
+        # Single round trip. The pre-image is needed by write listeners, and
+        # the post-image follows from it exactly, so this returns what
+        # ReturnDocument.AFTER would
+        before = await self.movies.find_one_and_update(
+            self._version_filter(movie_id, expected_updated_at),
+            self.update_document(update_data),
+            return_document=ReturnDocument.BEFORE
         )
-        
-        if result.modified_count:
-            return await self.movies.find_one({"id": movie_id})
-        return None
+        if before is None:
+            await self._check_precondition(movie_id, expected_updated_at)
+            return None
+
+        after = self.apply_update(before, update_data)
+        await self.notify_write("update", movie_id, before, after)
+        return after
 
-    async def delete_movie(self, movie_id: str) -> bool:
-        """Delete a movie"""
-        result = await self.movies.delete_one({"id": movie_id})
-        return result.deleted_count > 0
+    async def delete_movie(self, movie_id: str,
+                           expected_updated_at: Optional[datetime] = None) -> bool:
+        """Delete a movie, optionally only if it is still at ``expected_updated_at``"""
+        deleted = await self.movies.find_one_and_delete(
+            self._version_filter(movie_id, expected_updated_at)
+        )
+        if deleted is None:
+            await self._check_precondition(movie_id, expected_updated_at)
+            return False
+
+        await self.notify_write("delete", movie_id, deleted, None)
+        return True
 
     async def get_all_genres(self) -> List[str]:
         """Get all unique genres"""
@@ -114,10 +426,12 @@ class MovieDatabase:
             {"$sort": {"_id": 1}}
         ]
         
-        cursor = self.movies.aggregate(pipeline)
-        genres = []
-        async for doc in cursor:
-            genres.append(doc["_id"])
+        async with self._observe("aggregate", pipeline=pipeline) as observed:
+            cursor = self.movies.aggregate(pipeline)
+            genres = []
+            async for doc in cursor:
+                genres.append(doc["_id"])
+            observed["returned"] = len(genres)
         
         return genres
 
@@ -260,8 +574,15 @@ class MovieDatabase:
             }
         ]
 
+        for movie in initial_movies:
+            movie["runtime_minutes"] = parse_runtime_minutes(movie["duration"])
+            movie["vote_count"] = movie["vote_sum"] = 0
+            movie["weighted_rating"] = movie["rating"]
+            movie["schema_version"] = CURRENT_SCHEMA_VERSION
+
         # Insert all movies
         await self.movies.insert_many(initial_movies)
-        await self.create_indexes()
+        for movie in initial_movies:
+            await self.notify_write("insert", movie["id"], None, movie)
         
         return f"Successfully seeded database with {len(initial_movies)} movies"
\ No newline at end of file
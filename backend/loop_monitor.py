@@ -0,0 +1,127 @@
+from collections import deque
+from typing import List, Optional
+from datetime import datetime
+import asyncio
+import bisect
+import logging
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+class LoopLagMonitor:
+    """Measure event loop scheduling delay and catch what is blocking it.
+
+    A task sleeps ``interval`` seconds in a loop; how late it wakes up is the
+    lag, recorded in a histogram. A watchdog thread checks the task's heartbeat
+    and, when the loop has been stuck for longer than ``threshold_ms``, captures
+    the loop thread's stack while the blocking code is still running.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold_ms: float = 100.0,
+                 buckets_ms: Optional[List[float]] = None, max_stalls: int = 50):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.buckets_ms = buckets_ms or DEFAULT_BUCKETS_MS
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.samples = 0
+        self.total_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.stalls = deque(maxlen=max_stalls)
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._open_stall: Optional[dict] = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.observe(max(0.0, (now - expected) * 1000))
+
+    def observe(self, lag_ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, lag_ms)] += 1
+        self.samples += 1
+        self.total_lag_ms += lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+        stall = self._open_stall
+        if stall is not None:
+            stall["lag_ms"] = round(lag_ms, 2)
+            self._open_stall = None
+            logger.warning(f"Event loop blocked for {lag_ms:.0f}ms in {stall['task']}")
+
+    def _watch(self):
+        check_every = min(self.interval, self.threshold_ms / 1000) / 2
+        while not self._stopping.wait(check_every):
+            stalled_ms = (time.monotonic() - self._heartbeat - self.interval) * 1000
+            if stalled_ms < self.threshold_ms or self._open_stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            task = asyncio.current_task(self._loop)
+            self._open_stall = {
+                "at": datetime.utcnow().isoformat(),
+                "lag_ms": None,
+                "task": task.get_name() if task else None,
+                "coroutine": repr(task.get_coro()) if task else None,
+                "stack": traceback.format_stack(frame) if frame else [],
+            }
+            self.stalls.append(self._open_stall)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given fraction of samples"""
+        if not self.samples:
+            return None
+        target = fraction * self.samples
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets_ms[index] if index < len(self.buckets_ms) else self.max_lag_ms
+        return self.max_lag_ms
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets_ms] + ["inf"]
+        return {
+            "samples": self.samples,
+            "avg_lag_ms": round(self.total_lag_ms / self.samples, 3) if self.samples else None,
+            "p50_lag_ms": self.percentile(0.5),
+            "p99_lag_ms": self.percentile(0.99),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "histogram_ms": dict(zip(labels, self.counts)),
+            "stalls": len(self.stalls),
+        }
+
+    def recent_stalls(self, limit: int = 20) -> list:
+        return list(reversed(self.stalls))[:limit]
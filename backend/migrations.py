@@ -0,0 +1,265 @@
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from typing import Awaitable, Callable, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import time
+import uuid
+
+from models import parse_runtime_minutes
+from ratings import weighted_rating
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    """One schema step for the movies collection.
+
+    ``transform(doc)`` returns the fields to ``$set`` on a document at the
+    previous version; ``finalize(movies)`` runs once after every document has
+    been migrated, e.g. to build an index that needs the new field, and may
+    return a dict of notes recorded in the migration state.
+    """
+
+    def __init__(self, version: int, name: str,
+                 transform: Optional[Callable[[dict], dict]] = None,
+                 projection: Optional[dict] = None,
+                 finalize: Optional[Callable[..., Awaitable]] = None):
+        self.version = version
+        self.name = name
+        self.transform = transform
+        self.projection = projection
+        self.finalize = finalize
+
+
+async def _create_unique_id_index(movies):
+    """Give every movie after the first that shares an ``id`` (or has none) a
+    fresh one, then build the unique index. Without this the index build
+    fails on every run and later migrations never start."""
+    pipeline = [
+        {"$group": {"_id": "$id", "docs": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"$or": [{"count": {"$gt": 1}}, {"_id": None}]}},
+    ]
+    reassigned = 0
+    async for group in movies.aggregate(pipeline, allowDiskUse=True):
+        docs = sorted(group["docs"])
+        # The oldest document keeps the id; one without an id keeps nothing
+        for oid in docs[1:] if group["_id"] is not None else docs:
+            new_id = str(uuid.uuid4())
+            await movies.update_one({"_id": oid}, {"$set": {"id": new_id}})
+            logger.warning(f"Movie {oid} had duplicate or missing id {group['_id']!r}; reassigned {new_id}")
+            reassigned += 1
+    await movies.create_index("id", unique=True)
+    return {"reassigned_ids": reassigned} if reassigned else None
+
+
+def _vote_totals(doc: dict) -> dict:
+    fields = {"vote_count": doc.get("vote_count") or 0, "vote_sum": doc.get("vote_sum") or 0}
+    # Without an editorial rating there is no prior; leave weighted_rating
+    # unset rather than invent one
+    if doc.get("rating") is not None:
+        fields["weighted_rating"] = weighted_rating(doc["rating"], fields["vote_count"], fields["vote_sum"])
+    return fields
+
+
+MIGRATIONS = [
+    Migration(
+        1, "runtime_minutes",
+        transform=lambda doc: {"runtime_minutes": parse_runtime_minutes(doc.get("duration"))},
+        projection={"duration": 1},
+    ),
+    Migration(2, "unique_id_index", finalize=_create_unique_id_index),
+    Migration(3, "vote_totals", transform=_vote_totals, projection={"rating": 1, "vote_count": 1, "vote_sum": 1}),
+    # Version 1 read "2h30" as 120 minutes
+    Migration(
+        4, "runtime_minutes_trailing",
+        transform=lambda doc: {"runtime_minutes": parse_runtime_minutes(doc.get("duration"))},
+        projection={"duration": 1},
+    ),
+]
+
+# Version stamped on newly written documents
+CURRENT_SCHEMA_VERSION = MIGRATIONS[-1].version
+
+# First version at which every movie has weighted_rating
+WEIGHTED_RATING_VERSION = 3
+
+
+def _behind(version: int) -> dict:
+    """Filter for documents not yet at ``version``; a missing field means version 0"""
+    return {"$or": [{"schema_version": {"$exists": False}}, {"schema_version": {"$lt": version}}]}
+
+
+class MigrationRunner:
+    """Apply MIGRATIONS to existing documents in resumable, throttled batches.
+
+    Progress (last ``_id`` processed per migration) lives in the ``migrations``
+    collection, so a restart resumes where it stopped. A lease in the same
+    document keeps concurrent workers from running the same migration. Batch
+    size adapts to Mongo: it halves and the runner backs off when a batch takes
+    longer than ``target_batch_ms``, and grows back when batches are fast.
+    """
+
+    STATE_ID = "movies"
+
+    def __init__(self, movie_db, batch_size: int = 200, min_batch_size: int = 10,
+                 max_batch_size: int = 1000, target_batch_ms: float = 100.0,
+                 pause: float = 0.05, lease_seconds: int = 60, on_progress=None):
+        self.movies = movie_db.movies
+        self.state = movie_db.db.migrations
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_batch_ms = target_batch_ms
+        self.pause = pause
+        self.lease_seconds = lease_seconds
+        self.on_progress = on_progress
+        self.owner = uuid.uuid4().hex
+        self.running = False
+
+    async def completed_version(self) -> int:
+        state = await self.state.find_one({"_id": self.STATE_ID}, {"completed_version": 1}) or {}
+        return state.get("completed_version", 0)
+
+    async def status(self) -> dict:
+        state = await self.state.find_one({"_id": self.STATE_ID}) or {}
+        pending = await self.movies.count_documents(_behind(CURRENT_SCHEMA_VERSION))
+        return {
+            "target_version": CURRENT_SCHEMA_VERSION,
+            "completed_version": state.get("completed_version", 0),
+            "current": state.get("current"),
+            "documents_behind": pending,
+            "lease_owner": state.get("lease_owner"),
+            "running_here": self.running,
+            "last_error": state.get("last_error"),
+            "notes": state.get("notes", {}),
+        }
+
+    async def _acquire_lease(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        try:
+            return await self.state.find_one_and_update(
+                {"_id": self.STATE_ID, "$or": [
+                    {"lease_until": {"$exists": False}},
+                    {"lease_until": {"$lt": now}},
+                    {"lease_owner": self.owner},
+                ]},
+                {"$set": {"lease_owner": self.owner,
+                          "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease
+            return None
+
+    async def _save(self, **fields):
+        fields["lease_until"] = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        await self.state.update_one({"_id": self.STATE_ID, "lease_owner": self.owner}, {"$set": fields})
+
+    async def _release(self):
+        await self.state.update_one(
+            {"_id": self.STATE_ID, "lease_owner": self.owner},
+            {"$unset": {"lease_owner": "", "lease_until": ""}}
+        )
+
+    async def run(self) -> int:
+        """Run every pending migration; returns the schema version reached, or
+        -1 when another run holds the lease"""
+        if self.running:
+            return -1
+        self.running = True
+        try:
+            state = await self._acquire_lease()
+        except Exception:
+            self.running = False
+            raise
+        if state is None:
+            self.running = False
+            logger.info("Migrations are running in another worker")
+            return -1
+
+        completed = state.get("completed_version", 0)
+        try:
+            for migration in MIGRATIONS:
+                if migration.version <= completed:
+                    continue
+                current = state.get("current") or {}
+                last_id = current.get("last_id") if current.get("version") == migration.version else None
+                processed = current.get("processed", 0) if last_id is not None else 0
+
+                logger.info(f"Running migration {migration.version} ({migration.name})")
+                try:
+                    await self._migrate(migration, last_id, processed)
+                    notes = await migration.finalize(self.movies) if migration.finalize is not None else None
+                except Exception as e:
+                    # Kept in the state document so status() says why
+                    # migrations are stuck, not just that they are
+                    await self._save(last_error={
+                        "version": migration.version,
+                        "name": migration.name,
+                        "error": str(e),
+                        "at": datetime.utcnow(),
+                    })
+                    raise
+
+                completed = migration.version
+                fields = {"completed_version": completed, "current": None, "last_error": None}
+                if notes:
+                    fields[f"notes.{migration.version}"] = notes
+                await self._save(**fields)
+                state["current"] = None
+                logger.info(f"Migration {migration.version} ({migration.name}) complete")
+        finally:
+            self.running = False
+            await self._release()
+        return completed
+
+    async def _migrate(self, migration: Migration, last_id, processed: int):
+        total = processed + await self.movies.count_documents(_behind(migration.version))
+        batch_size = self.batch_size
+
+        while True:
+            query = _behind(migration.version)
+            if last_id is not None:
+                query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+            projection = dict(migration.projection or {}, schema_version=1)
+
+            started = time.perf_counter()
+            batch = await self.movies.find(query, projection).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+            if not batch:
+                # Documents skipped by the guard below are picked up by
+                # another pass from the start
+                if not await self.movies.count_documents(_behind(migration.version)):
+                    return
+                last_id = None
+                continue
+
+            operations = []
+            for doc in batch:
+                fields = migration.transform(doc) if migration.transform else {}
+                fields["schema_version"] = migration.version
+                # Guard on the version and source fields read, so a document
+                # rewritten since this batch was read is left for the next pass
+                guard = {"_id": doc["_id"], "schema_version": doc.get("schema_version")}
+                for field in migration.projection or {}:
+                    guard[field] = doc.get(field)
+                operations.append(UpdateOne(guard, {"$set": fields}))
+            await self.movies.bulk_write(operations, ordered=False)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            last_id = batch[-1]["_id"]
+            processed += len(batch)
+            await self._save(current={"version": migration.version, "name": migration.name,
+                                      "last_id": last_id, "processed": processed, "total": total})
+            if self.on_progress:
+                self.on_progress(migration, processed, total)
+
+            # Throttle on observed latency: back off when Mongo is slow
+            if elapsed_ms > self.target_batch_ms:
+                batch_size = max(self.min_batch_size, batch_size // 2)
+                await asyncio.sleep(min(5.0, elapsed_ms / 1000))
+            else:
+                batch_size = min(self.max_batch_size, int(batch_size * 1.25) + 1)
+                await asyncio.sleep(self.pause)
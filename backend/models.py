@@ -1,8 +1,41 @@
 from pydantic import BaseModel, Field, validator
 from typing import List, Optional
 from datetime import datetime
+import re
 import uuid
 
+_HOURS = re.compile(r"(\d+)\s*h")
+_MINUTES = re.compile(r"(\d+)\s*m")
+_NUMBER = re.compile(r"^\s*(\d+)\s*$")
+# A bare number after the hours, as in "2h30" or "2 hours 30"
+_TRAILING_MINUTES = re.compile(r"[a-z\s]*(\d+)\s*$")
+
+def parse_runtime_minutes(duration: Optional[str]) -> Optional[int]:
+    """Parse free-text durations such as "142 min", "2h 22m", "2h22" or "142" into minutes"""
+    if not duration:
+        return None
+    text = duration.lower()
+    hours = _HOURS.search(text)
+    minutes = _MINUTES.search(text)
+    if hours and not minutes:
+        minutes = _TRAILING_MINUTES.match(text, hours.end())
+    if hours or minutes:
+        return (int(hours.group(1)) * 60 if hours else 0) + (int(minutes.group(1)) if minutes else 0)
+    number = _NUMBER.match(text)
+    return int(number.group(1)) if number else None
+
+VALID_GENRES = [
+    "Action", "Adventure", "Animation", "Biography", "Comedy", "Crime", 
+    "Documentary", "Drama", "Family", "Fantasy", "History", "Horror", 
+    "Music", "Mystery", "Romance", "Sci-Fi", "Sport", "Thriller", "War", "Western"
+]
+
+def validate_genres(v):
+    for genre in v or []:
+        if genre not in VALID_GENRES:
+            raise ValueError(f'Invalid genre: {genre}')
+    return v
+
 class MovieBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=200)
     year: int = Field(..., ge=1800, le=2030)
@@ -18,24 +51,32 @@ class MovieBase(BaseModel):
 
     @validator('genre')
     def validate_genre(cls, v):
-        valid_genres = [
-            "Action", "Adventure", "Animation", "Biography", "Comedy", "Crime", 
-            "Documentary", "Drama", "Family", "Fantasy", "History", "Horror", 
-            "Music", "Mystery", "Romance", "Sci-Fi", "Sport", "Thriller", "War", "Western"
-        ]
-        for genre in v:
-            if genre not in valid_genres:
-                raise ValueError(f'Invalid genre: {genre}')
-        return v
+        return validate_genres(v)
 
 class MovieCreate(MovieBase):
     pass
 
 class Movie(MovieBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    # Derived from duration so runtime can be indexed, filtered and sorted;
+    # never taken from client input
+    runtime_minutes: Optional[int] = Field(None, ge=0)
+    # User votes, and the editorial rating blended with them; documents not
+    # yet migrated have neither and fall back to the editorial rating
+    vote_count: int = Field(default=0, ge=0)
+    weighted_rating: Optional[float] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+    @validator('runtime_minutes', always=True)
+    def derive_runtime_minutes(cls, v, values):
+        parsed = parse_runtime_minutes(values.get('duration'))
+        return parsed if parsed is not None else v
+
+    @validator('weighted_rating', always=True)
+    def default_weighted_rating(cls, v, values):
+        return v if v is not None else values.get('rating')
+
     class Config:
         from_attributes = True
         json_encoders = {
@@ -55,6 +96,21 @@ class MovieUpdate(BaseModel):
     cast: Optional[List[str]] = Field(None, min_items=1)
     featured: Optional[bool] = None
 
+    # Fields left out are unchanged; an explicit null would be written as-is
+    # and break every later read of the movie
+    @validator('*', pre=True)
+    def reject_null(cls, v):
+        if v is None:
+            raise ValueError('may not be null')
+        return v
+
+    @validator('genre')
+    def validate_genre(cls, v):
+        return validate_genres(v)
+
+class RatingCreate(BaseModel):
+    score: int = Field(..., ge=1, le=10)
+
 class SearchQuery(BaseModel):
     q: str = Field(..., min_length=1, max_length=100)
 
@@ -0,0 +1,57 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+import asyncio
+import contextvars
+import functools
+
+
+class CpuOffload:
+    """Run CPU-bound work off the event loop.
+
+    ``thread`` mode keeps the loop responsive by letting it take the GIL
+    between bytecode slices and preserves context variables (tracing spans);
+    ``process`` mode gives real parallelism for picklable functions and
+    arguments at the cost of serializing them.
+    """
+
+    def __init__(self, mode: str = "thread", workers: int = 2, min_items: int = 50):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown offload mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        # Below this many items the hand-off costs more than it saves
+        self.min_items = min_items
+        self._executor: Optional[Executor] = None
+        self.submitted = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu-offload")
+        return self._executor
+
+    async def run(self, fn: Callable, *args):
+        self.submitted += 1
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args))
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def run_if_large(self, fn: Callable, items, *args):
+        """Offload ``fn(items, *args)`` only when there are enough items to matter"""
+        if len(items) < self.min_items:
+            return fn(items, *args)
+        return await self.run(fn, items, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def snapshot(self) -> dict:
+        return {"mode": self.mode, "workers": self.workers, "min_items": self.min_items,
+                "submitted": self.submitted}
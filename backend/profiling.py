@@ -0,0 +1,170 @@
+from contextvars import ContextVar
+from pathlib import Path
+from typing import List, Optional
+from datetime import datetime
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import json
+import logging
+import random
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = b"x-profile-signature"
+
+# Per-phase timings of the request being profiled, if any
+_current_phases: ContextVar[Optional[dict]] = ContextVar("current_phases", default=None)
+
+
+def sign_path(secret: str, path: str, expires: int) -> str:
+    """X-Profile-Signature value that profiles ``path`` until the unix time ``expires``"""
+    message = f"{path}\n{expires}".encode()
+    return f"{expires}.{hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()}"
+
+
+class RequestProfiler:
+    """Capture cProfile dumps of selected requests into a rotating directory.
+
+    A request is profiled when it carries a valid ``X-Profile-Signature``
+    (``<expires>.<HMAC of the path and expires>`` with the shared secret) that
+    has not expired, or is picked by ``sample_rate``. Signatures expiring more
+    than ``max_signature_ttl`` seconds ahead are refused, so a leaked one stops
+    working. ``exempt_paths`` are never profiled: a streaming response would
+    keep cProfile on for the life of the connection, profiling everything
+    else the process does and blocking every other profile. Each
+    profile is a standard ``.prof`` file (pstats; opens in snakeviz or
+    ``python -m pstats``) with a ``.json`` sidecar holding the phase breakdown.
+    cProfile sees the whole thread, so only one request is profiled at a time
+    and concurrent requests may still show up in its stacks.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.0,
+                 secret: Optional[str] = None, max_files: int = 50,
+                 max_signature_ttl: int = 3600, exempt_paths: Optional[List[str]] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self.max_files = max_files
+        self.max_signature_ttl = max_signature_ttl
+        self.exempt_paths = set(exempt_paths or [])
+        self._active = False
+
+    def should_profile(self, scope) -> bool:
+        if self._active or scope["path"] in self.exempt_paths:
+            return False
+        if self.secret:
+            for name, value in scope.get("headers", []):
+                if name == SIGNATURE_HEADER and self._valid_signature(scope["path"], value.decode("latin-1")):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _valid_signature(self, path: str, signature: str) -> bool:
+        expires, _, _ = signature.partition(".")
+        try:
+            expires = int(expires)
+        except ValueError:
+            return False
+        if not 0 <= expires - time.time() <= self.max_signature_ttl:
+            return False
+        return hmac.compare_digest(signature, sign_path(self.secret, path, expires))
+
+    def observe_query(self, op: str, spec: dict, started_at: float, duration_ms: float,
+                      returned: Optional[int]):
+        """MovieDatabase query observer attributing time to the database phase"""
+        phases = _current_phases.get()
+        if phases is not None:
+            phases["database_ms"] += duration_ms
+            phases["queries"] += 1
+
+    async def save(self, profile: cProfile.Profile, metadata: dict):
+        stem = f"{metadata['started_at'].replace(':', '')}-{metadata['id']}"
+        await asyncio.get_running_loop().run_in_executor(None, self._write, profile, stem, metadata)
+
+    def _write(self, profile: cProfile.Profile, stem: str, metadata: dict):
+        profile.dump_stats(str(self.directory / f"{stem}.prof"))
+        (self.directory / f"{stem}.json").write_text(json.dumps(metadata))
+
+        profiles = sorted(self.directory.glob("*.prof"))
+        for stale in profiles[:max(0, len(profiles) - self.max_files)]:
+            stale.unlink(missing_ok=True)
+            stale.with_suffix(".json").unlink(missing_ok=True)
+
+    def recent(self, limit: int = 20) -> list:
+        entries = []
+        for sidecar in sorted(self.directory.glob("*.json"), reverse=True)[:limit]:
+            try:
+                entries.append(json.loads(sidecar.read_text()))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def profile_path(self, profile_id: str) -> Optional[Path]:
+        if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+            return None
+        matches = list(self.directory.glob(f"*-{profile_id}.prof"))
+        return matches[0] if matches else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware running selected requests under a RequestProfiler.
+
+    Only installed when profiling is configured, so it costs nothing otherwise.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        phases = {"database_ms": 0.0, "queries": 0, "handler_ms": 0.0, "response_ms": 0.0}
+        marks = {"response_start": None, "status": None}
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                marks["response_start"] = time.perf_counter()
+                marks["status"] = message["status"]
+                message.setdefault("headers", []).append((b"x-profile-id", profile_id.encode()))
+            await send(message)
+
+        token = _current_phases.set(phases)
+        profile = cProfile.Profile()
+        self.profiler._active = True
+        started_at = datetime.utcnow().isoformat()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            profile.disable()
+            finished = time.perf_counter()
+            self.profiler._active = False
+            _current_phases.reset(token)
+
+            response_start = marks["response_start"] or finished
+            phases["handler_ms"] = (response_start - started) * 1000 - phases["database_ms"]
+            phases["response_ms"] = (finished - response_start) * 1000
+            metadata = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": marks["status"],
+                "started_at": started_at,
+                "total_ms": round((finished - started) * 1000, 3),
+                "phases": {k: round(v, 3) if isinstance(v, float) else v for k, v in phases.items()},
+            }
+            try:
+                await self.profiler.save(profile, metadata)
+            except Exception as e:
+                logger.error(f"Error saving profile {profile_id}: {str(e)}")
@@ -0,0 +1,142 @@
+from collections import deque
+from typing import Optional
+from datetime import datetime
+import asyncio
+import json
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+def redact(value):
+    """Keep the shape of a filter or pipeline but replace every literal with '?'"""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+class SlowQueryLog:
+    """Record MovieDatabase queries slower than a threshold.
+
+    Registered as a query observer. Slow queries are kept in a bounded ring
+    buffer with their redacted filter shape; a sample of them is re-run through
+    ``explain("executionStats")`` in the background to capture how many
+    documents and keys the plan examined.
+    """
+
+    def __init__(self, movie_db, threshold_ms: float = 100.0,
+                 explain_sample_rate: float = 0.1, capacity: int = 200):
+        self.db = movie_db.db
+        self.collection = movie_db.movies.name
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.entries = deque(maxlen=capacity)
+        self.total_slow = 0
+        self._explaining = set()
+        # Strong references: the loop only keeps weak ones to running tasks
+        self._explain_tasks = set()
+
+    def record(self, op: str, spec: dict, started_at: float, duration_ms: float,
+               returned: Optional[int]):
+        if duration_ms < self.threshold_ms:
+            return
+
+        shape = {key: redact(value) if key in ("filter", "pipeline") else value
+                 for key, value in spec.items()}
+        entry = {
+            "op": op,
+            "shape": shape,
+            "duration_ms": round(duration_ms, 2),
+            "docs_returned": returned,
+            "docs_examined": None,
+            "keys_examined": None,
+            "plan": None,
+            "started_at": datetime.utcfromtimestamp(started_at).isoformat(),
+        }
+        self.entries.append(entry)
+        self.total_slow += 1
+        logger.warning(
+            f"Slow query {op} {json.dumps(shape, default=str)} took {duration_ms:.1f}ms, "
+            f"returned {returned}"
+        )
+
+        shape_key = op + json.dumps(shape, sort_keys=True, default=str)
+        if random.random() < self.explain_sample_rate and shape_key not in self._explaining:
+            self._explaining.add(shape_key)
+            task = asyncio.create_task(self._explain(op, spec, entry))
+            self._explain_tasks.add(task)
+            task.add_done_callback(self._explain_tasks.discard)
+            task.add_done_callback(lambda _: self._explaining.discard(shape_key))
+
+    def _explain_command(self, op: str, spec: dict) -> Optional[dict]:
+        collection = spec.get("collection", self.collection)
+        if op == "find":
+            command = {"find": collection, "filter": spec.get("filter", {})}
+            for key in ("sort", "skip", "limit"):
+                if spec.get(key):
+                    command[key] = spec[key]
+            return command
+        if op == "count":
+            return {"count": collection, "query": spec.get("filter", {})}
+        if op == "aggregate":
+            return {"aggregate": collection, "pipeline": spec["pipeline"], "cursor": {}}
+        return None
+
+    async def _explain(self, op: str, spec: dict, entry: dict):
+        command = self._explain_command(op, spec)
+        if command is None:
+            return
+        try:
+            explained = await self.db.command("explain", command, verbosity="executionStats")
+        except Exception as e:
+            logger.error(f"Error explaining slow {op}: {str(e)}")
+            return
+
+        stats = _find_key(explained, "executionStats") or {}
+        entry["docs_examined"] = stats.get("totalDocsExamined")
+        entry["keys_examined"] = stats.get("totalKeysExamined")
+        winning_plan = _find_key(explained, "winningPlan")
+        entry["plan"] = _plan_stages(winning_plan) if winning_plan else None
+
+    def recent(self, limit: int = 50) -> list:
+        return list(reversed(self.entries))[:limit]
+
+    def snapshot(self) -> dict:
+        return {"threshold_ms": self.threshold_ms, "total_slow": self.total_slow}
+
+
+def _find_key(document, key):
+    """Depth-first search for ``key``; aggregate explains nest it under stages"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan: dict) -> str:
+    """Summarize a winning plan as e.g. 'LIMIT <- FETCH <- IXSCAN {rating: -1}'"""
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if stage == "IXSCAN":
+            stage += " " + json.dumps(plan.get("keyPattern", {}))
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
@@ -0,0 +1,163 @@
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Number of votes the editorial rating counts as in the weighted rating: with
+# few user votes it dominates, and it fades out as votes accumulate
+PRIOR_VOTES = 25
+
+
+def weighted_rating(rating: float, vote_count: int, vote_sum: float) -> float:
+    """Bayesian average of user votes with the editorial rating as the prior"""
+    return (vote_sum + PRIOR_VOTES * rating) / (vote_count + PRIOR_VOTES)
+
+
+# Fields a vote flush writes; changes touching only these are not edits
+VOTE_FIELDS = {"vote_count", "vote_sum", "weighted_rating"}
+
+# weighted_rating() over the stored fields, for pipeline updates
+WEIGHTED_RATING_EXPR = {"$divide": [
+    {"$add": [{"$ifNull": ["$vote_sum", 0]}, {"$multiply": [PRIOR_VOTES, "$rating"]}]},
+    {"$add": [{"$ifNull": ["$vote_count", 0]}, PRIOR_VOTES]},
+]}
+
+
+class RatingBacklogFull(Exception):
+    """Raised when too many movies have votes waiting to be flushed"""
+
+
+class RatingIngest:
+    """Buffer user votes in memory and apply them to Mongo in periodic batches.
+
+    Votes are summed per movie in shards keyed by a hash of the movie id, so
+    accepting a vote is two additions and any number of votes for one movie
+    between flushes becomes a single update. Every ``flush_interval`` each
+    shard is swapped out and written as one unordered bulk_write of pipeline
+    updates that add to ``vote_count``/``vote_sum`` and recompute
+    ``weighted_rating`` in the same write. Votes still buffered when the
+    process dies are lost.
+    """
+
+    def __init__(self, movie_db, shards: int = 16, flush_interval: float = 1.0,
+                 max_pending_movies: int = 100000):
+        self.movie_db = movie_db
+        self.flush_interval = flush_interval
+        self.max_pending_movies = max_pending_movies
+        # movie id -> [vote count, vote sum]
+        self._shards: List[Dict[str, list]] = [{} for _ in range(shards)]
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self.accepted = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.unknown_movies = 0
+        self.last_flush_ms: Optional[float] = None
+
+    def _shard(self, movie_id: str) -> Dict[str, list]:
+        return self._shards[zlib.crc32(movie_id.encode()) % len(self._shards)]
+
+    def pending_movies(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def submit(self, movie_id: str, score: float):
+        shard = self._shard(movie_id)
+        totals = shard.get(movie_id)
+        if totals is None:
+            if self.pending_movies() >= self.max_pending_movies:
+                raise RatingBacklogFull(f"Rating backlog is full ({self.max_pending_movies} movies pending)")
+            totals = shard[movie_id] = [0, 0]
+        totals[0] += 1
+        totals[1] += score
+        self.accepted += 1
+
+    def _requeue(self, votes: Dict[str, list]):
+        for movie_id, (count, total) in votes.items():
+            totals = self._shard(movie_id).setdefault(movie_id, [0, 0])
+            totals[0] += count
+            totals[1] += total
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let an in-flight flush finish, then flush what is left"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    async def flush(self):
+        started = time.perf_counter()
+        for index, votes in enumerate(self._shards):
+            if not votes:
+                continue
+            self._shards[index] = {}
+            await self._flush_shard(votes)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    async def _flush_shard(self, votes: Dict[str, list]):
+        movie_ids = list(votes)
+        operations = [
+            UpdateOne({"id": movie_id}, [
+                {"$set": {
+                    "vote_count": {"$add": [{"$ifNull": ["$vote_count", 0]}, votes[movie_id][0]]},
+                    "vote_sum": {"$add": [{"$ifNull": ["$vote_sum", 0]}, votes[movie_id][1]]},
+                }},
+                {"$set": {"weighted_rating": WEIGHTED_RATING_EXPR}},
+            ])
+            for movie_id in movie_ids
+        ]
+        self.flushes += 1
+        try:
+            result = await self.movie_db.movies.bulk_write(operations, ordered=False)
+        except asyncio.CancelledError:
+            # Whether the write landed is unknown; keeping the votes risks
+            # counting them twice, dropping them loses them for certain
+            self._requeue(votes)
+            raise
+        except BulkWriteError as e:
+            # Unordered: everything but the reported failures was applied
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            self._requeue({movie_ids[i]: votes[movie_ids[i]] for i in failed})
+            self.failed_flushes += 1
+            self.flushed += sum(votes[movie_ids[i]][0] for i in range(len(movie_ids)) if i not in failed)
+            logger.error(f"Rating flush failed for {len(failed)}/{len(operations)} movies: {str(e)}")
+            return
+        except Exception as e:
+            self._requeue(votes)
+            self.failed_flushes += 1
+            logger.error(f"Rating flush failed, {len(operations)} movies requeued: {str(e)}")
+            return
+
+        self.flushed += sum(count for count, _ in votes.values())
+        # Votes for ids that match no movie are dropped
+        self.unknown_movies += len(operations) - result.matched_count
+
+    def snapshot(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "flushed": self.flushed,
+            "pending_movies": self.pending_movies(),
+            "pending_votes": sum(totals[0] for shard in self._shards for totals in shard.values()),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "unknown_movies": self.unknown_movies,
+            "last_flush_ms": self.last_flush_ms,
+        }
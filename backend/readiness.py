@@ -0,0 +1,57 @@
+from typing import Dict, Optional
+from datetime import datetime
+import time
+
+
+class Readiness:
+    """Track warm-up progress of background components.
+
+    Components are registered up front as ``pending`` and move through
+    ``running`` to ``ready`` (or ``failed``). Only components registered with
+    ``required=True`` gate readiness; the rest are reported for visibility.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.components: Dict[str, dict] = {}
+
+    def register(self, name: str, required: bool = True):
+        self.components[name] = {
+            "status": "pending",
+            "required": required,
+            "progress": None,
+            "detail": None,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+    def update(self, name: str, status: Optional[str] = None,
+               progress: Optional[float] = None, detail: Optional[str] = None):
+        component = self.components.setdefault(name, {"required": False})
+        if status is not None:
+            component["status"] = status
+        if progress is not None:
+            component["progress"] = round(progress, 3)
+        if detail is not None:
+            component["detail"] = detail
+        component["updated_at"] = datetime.utcnow().isoformat()
+
+    def ready(self, name: str, detail: Optional[str] = None):
+        self.update(name, status="ready", progress=1.0, detail=detail)
+
+    def failed(self, name: str, detail: str):
+        self.update(name, status="failed", detail=detail)
+
+    @property
+    def is_ready(self) -> bool:
+        return all(
+            component["status"] == "ready"
+            for component in self.components.values()
+            if component.get("required")
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 3),
+            "components": self.components,
+        }
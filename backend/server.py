@@ -1,15 +1,35 @@
-from fastapi import FastAPI, APIRouter, Query, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, Query, HTTPException, Depends, Header, Response
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
 from pathlib import Path
 from typing import List, Optional
+from datetime import datetime
 import math
+import asyncio
+import base64
+import hmac
+import json
+import re
 
-from models import Movie, MovieCreate, MovieUpdate, SearchQuery, MovieResponse
-from database import MovieDatabase
+from models import Movie, MovieCreate, MovieUpdate, RatingCreate, SearchQuery, MovieResponse
+from database import MovieDatabase, PreconditionFailed
+from change_feed import ChangeFeed, format_sse
+from admission import AdmissionController, AdmissionMiddleware, RoutePolicy
+from readiness import Readiness
+from stats import StatsRollups, DIMENSIONS
+from query_log import SlowQueryLog
+from write_behind import WriteBehindQueue, WriteBacklogFull, MovieNotFound
+from suggest import SuggestIndex
+from profiling import RequestProfiler, ProfilingMiddleware
+from tracing import Tracer, SpanExporter, TracedRoute, TracingMiddleware, trace_span
+from fastapi.routing import APIRoute
+from loop_monitor import LoopLagMonitor
+from offload import CpuOffload
+from migrations import MigrationRunner, CURRENT_SCHEMA_VERSION, WEIGHTED_RATING_VERSION
+from ratings import RatingIngest, RatingBacklogFull, VOTE_FIELDS
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -19,40 +39,270 @@ mongo_url = os.environ['MONGO_URL']
 db_name = os.environ['DB_NAME']
 movie_db = MovieDatabase(mongo_url, db_name)
 
+# Warm-up progress reported by /api/health/ready
+readiness = Readiness()
+readiness.register("database")
+readiness.register("indexes", required=False)
+readiness.register("stats", required=False)
+readiness.register("suggest", required=False)
+readiness.register("migrations", required=False)
+background_tasks = set()
+
+# Change feed: tails writes to `movies` (change stream, or polling `updated_at`
+# when CHANGE_FEED_MODE=poll or the deployment has no oplog)
+change_feed = ChangeFeed(
+    movie_db,
+    mode=os.environ.get('CHANGE_FEED_MODE', 'auto'),
+    poll_interval=float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', '2.0')),
+    poll_overlap=float(os.environ.get('CHANGE_FEED_POLL_OVERLAP', '5.0')),
+    # Vote flushes touch many movies a second and change nothing listeners use
+    ignore_fields=VOTE_FIELDS
+)
+
+# Rating rollups maintained on every write made through movie_db
+stats_rollups = StatsRollups(movie_db, flush_interval=float(os.environ.get('STATS_FLUSH_INTERVAL', '1.0')))
+movie_db.add_write_listener(stats_rollups.apply)
+
+# Event loop lag monitoring, and a pool for CPU-bound work that would
+# otherwise stall every request on this worker's loop
+loop_monitor = LoopLagMonitor(threshold_ms=float(os.environ.get('LOOP_LAG_THRESHOLD_MS', '100')))
+cpu_offload = CpuOffload(
+    mode=os.environ.get('CPU_OFFLOAD_MODE', 'thread'),
+    workers=int(os.environ.get('CPU_OFFLOAD_WORKERS', '2')),
+    min_items=int(os.environ.get('CPU_OFFLOAD_MIN_ITEMS', '50'))
+)
+
+# Typeahead trie, kept current from local writes and the change feed
+suggest_index = SuggestIndex(top_k=int(os.environ.get('SUGGEST_TOP_K', '10')))
+SUGGEST_FIELDS = ["id", "title", "year", "rating", "poster", "director", "cast"]
+# Changes that arrive while a rebuild runs off the loop, replayed after the swap
+suggest_replay = None
+
+def index_movie_write(op, movie_id, before, after):
+    if suggest_replay is not None:
+        suggest_replay.append((op, movie_id, after))
+    if op == "delete":
+        suggest_index.remove(movie_id)
+    elif after is not None:
+        suggest_index.upsert(after)
+
+async def index_movie_change(event):
+    if suggest_replay is not None:
+        suggest_replay.append((event["op"], event.get("id"), event.get("movie")))
+    if suggest_index.apply_event(event) == "reset":
+        run_in_background(build_suggest_index())
+
+movie_db.add_write_listener(index_movie_write)
+change_feed.add_listener(index_movie_change)
+
+# Slow-query log with sampled explain plans
+slow_query_log = SlowQueryLog(
+    movie_db,
+    threshold_ms=float(os.environ.get('SLOW_QUERY_MS', '100')),
+    explain_sample_rate=float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+)
+movie_db.add_query_observer(slow_query_log.record)
+
+# Opt-in request profiling: signed X-Profile-Signature header and/or sampling.
+# Left as None (no middleware at all) unless configured.
+profiler = None
+if os.environ.get('PROFILE_SECRET') or float(os.environ.get('PROFILE_SAMPLE_RATE', '0')) > 0:
+    profiler = RequestProfiler(
+        os.environ.get('PROFILE_DIR', str(ROOT_DIR / 'profiles')),
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+        secret=os.environ.get('PROFILE_SECRET'),
+        max_files=int(os.environ.get('PROFILE_MAX_FILES', '50')),
+        max_signature_ttl=int(os.environ.get('PROFILE_SIGNATURE_MAX_TTL', '3600')),
+        # The SSE stream stays open indefinitely; probes and metrics are noise
+        exempt_paths=["/api/events/movies", "/api/metrics", "/api/health/live", "/api/health/ready"]
+    )
+    movie_db.add_query_observer(profiler.observe_query)
+
+# Request tracing, enabled by configuring an export target: a JSON-lines file
+# and/or an OTLP/HTTP collector endpoint
+tracer = None
+if os.environ.get('TRACE_EXPORT_FILE') or os.environ.get('TRACE_OTLP_ENDPOINT'):
+    tracer = Tracer(
+        SpanExporter(
+            "imdb-clone-api",
+            file_path=os.environ.get('TRACE_EXPORT_FILE'),
+            otlp_endpoint=os.environ.get('TRACE_OTLP_ENDPOINT')
+        ),
+        sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', '1.0'))
+    )
+    movie_db.add_query_observer(tracer.observe_query)
+
+# Optional batched write path for POST and PATCH /api/movies?write_mode=...
+write_queue = WriteBehindQueue(
+    movie_db,
+    flush_interval_ms=float(os.environ.get('WRITE_BEHIND_FLUSH_MS', '5')),
+    max_batch=int(os.environ.get('WRITE_BEHIND_MAX_BATCH', '100')),
+    max_backlog=int(os.environ.get('WRITE_BEHIND_MAX_BACKLOG', '10000'))
+)
+
+# User votes, summed in memory and flushed to vote totals and weighted_rating
+rating_ingest = RatingIngest(
+    movie_db,
+    shards=int(os.environ.get('RATING_SHARDS', '16')),
+    flush_interval=float(os.environ.get('RATING_FLUSH_INTERVAL', '1.0')),
+    max_pending_movies=int(os.environ.get('RATING_MAX_PENDING_MOVIES', '100000'))
+)
+
+# Schema migrations for existing movies, run in throttled batches during
+# warm-up; reads tolerate a mix of schema versions until they finish
+migration_runner = MigrationRunner(
+    movie_db,
+    batch_size=int(os.environ.get('MIGRATION_BATCH_SIZE', '200')),
+    target_batch_ms=float(os.environ.get('MIGRATION_TARGET_BATCH_MS', '100')),
+    on_progress=lambda migration, done, total: readiness.update(
+        "migrations", progress=done / total if total else 1.0,
+        detail=f"v{migration.version} {migration.name}: {done}/{total}")
+)
+
+# Search totals stop counting here and are reported as estimates; this many
+# ranked results are stored per search, for SEARCH_RESULT_TTL seconds, so
+# later pages do not run the match again
+SEARCH_COUNT_CAP = int(os.environ.get('SEARCH_COUNT_CAP', '1000'))
+SEARCH_RESULT_TTL = int(os.environ.get('SEARCH_RESULT_TTL', '600'))
+
+# Admission control: per-route concurrency budgets, shedding with 503 when
+# database latency or queue depth crosses the configured limits
+admission = AdmissionController(
+    movie_db.db,
+    policies=[
+        # Single-document lookups are cheap; keep serving them longest
+        RoutePolicy("movie_detail", r"^/api/movies/(?!search$|suggest$|featured$|top-rated$)[^/]+$",
+                    max_concurrency=64, max_queue=256, priority=1),
+        RoutePolicy("search", r"^/api/movies/search$", max_concurrency=16, max_queue=32),
+        # Votes only touch the in-memory buffer; admit them in bulk
+        RoutePolicy("ratings", r"^/api/movies/[^/]+/ratings$", max_concurrency=256, max_queue=1024,
+                    priority=1),
+        RoutePolicy("default", r"^/api/", max_concurrency=32, max_queue=128),
+    ],
+    latency_threshold_ms=float(os.environ.get('ADMISSION_DB_LATENCY_MS', '250')),
+    max_queue_wait=float(os.environ.get('ADMISSION_MAX_QUEUE_WAIT', '2.0')),
+    serve_stale=os.environ.get('ADMISSION_SERVE_STALE', 'false').lower() == 'true',
+    # Public reads that may be answered from the stale cache while shedding
+    stale_paths=[r"^/api/movies(/[^/]+)?$", r"^/api/movies/genre/[^/]+$", r"^/api/home$",
+                 r"^/api/stats(/[^/]+)?$", r"^/api/genres$"],
+    # Suggestions are served from memory and never wait on Mongo
+    exempt_paths=["/api/events/movies", "/api/metrics", "/api/health/live", "/api/health/ready",
+                  "/api/movies/suggest"]
+)
+
 # Create the main app without a prefix
 app = FastAPI(title="IMDB Clone API", version="1.0.0")
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TracedRoute if tracer else APIRoute)
 
 # Dependency
 async def get_movie_db():
     return movie_db
 
+# Admin endpoints require X-Admin-Token to match ADMIN_TOKEN; they stay
+# closed until it is configured
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def to_movies(movies_data: List[dict]) -> List[Movie]:
+    """Convert MongoDB documents to Movie objects"""
+    with trace_span("serialize.models", count=len(movies_data)):
+        movies = []
+        for movie_data in movies_data:
+            # Remove MongoDB _id field
+            if '_id' in movie_data:
+                del movie_data['_id']
+            movies.append(Movie(**movie_data))
+        return movies
+
+async def convert_movies(movies_data: List[dict]) -> List[Movie]:
+    """to_movies, moved off the event loop for large result sets"""
+    return await cpu_offload.run_if_large(to_movies, movies_data)
+
+# ETags carry the movie's updated_at so If-Match needs no extra read
+def movie_etag(movie_data: dict) -> str:
+    return f'"{movie_data["updated_at"].isoformat()}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[datetime]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return datetime.fromisoformat(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+# Search cursors are opaque to clients: base64 JSON of the query, the stored
+# results and position in them, the sort key of the last result returned (to
+# seek from once the stored results expire or run out), and the first page's
+# total
+def encode_search_cursor(q: str, last: dict, total: int, total_is_estimate: bool,
+                         results: Optional[str] = None, stored: int = 0, offset: int = 0) -> str:
+    payload = {"q": q, "after": [last["score"], last["rank"], last["id"]],
+               "total": total, "estimate": total_is_estimate,
+               "results": results, "stored": stored, "offset": offset}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_search_cursor(cursor: str, q: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if payload["q"] != q or len(payload["after"]) != 3:
+            raise ValueError("cursor belongs to a different query")
+        if not isinstance(payload["offset"], int) or payload["offset"] < 0:
+            raise ValueError("bad offset")
+        return payload
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid search cursor")
+
+def search_highlights(movie_data: dict, q: str) -> dict:
+    """[start, end) offsets of each case-insensitive match, per field"""
+    pattern = re.compile(re.escape(q), re.IGNORECASE)
+    fields = {"title": movie_data.get("title"), "director": movie_data.get("director")}
+    for index, genre in enumerate(movie_data.get("genre") or []):
+        fields[f"genre.{index}"] = genre
+    highlights = {}
+    for field, value in fields.items():
+        offsets = [[m.start(), m.end()] for m in pattern.finditer(value or "")]
+        if offsets:
+            highlights[field] = offsets
+    return highlights
+
 # Health check
 @api_router.get("/")
 async def root():
     return {"message": "IMDB Clone API is running", "version": "1.0.0"}
 
+# Liveness probe: the process is up and the event loop is responsive
+@api_router.get("/health/live")
+async def health_live():
+    return {"status": "alive"}
+
+# Readiness probe: required warm-up steps have completed
+@api_router.get("/health/ready")
+async def health_ready():
+    snapshot = readiness.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
+
 # Get all movies with filtering and pagination
 @api_router.get("/movies", response_model=MovieResponse)
 async def get_movies(
     genre: Optional[str] = Query(None, description="Filter by genre"),
-    sortBy: Optional[str] = Query("rating", description="Sort by: rating, year, title"),
+    sortBy: Optional[str] = Query("rating", description="Sort by: rating, year, title, runtime"),
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(20, ge=1, le=100, description="Movies per page"),
+    minRuntime: Optional[int] = Query(None, ge=0, description="Minimum runtime in minutes"),
+    maxRuntime: Optional[int] = Query(None, ge=0, description="Maximum runtime in minutes"),
     db: MovieDatabase = Depends(get_movie_db)
 ):
     try:
-        movies_data, total = await db.get_all_movies(genre, sortBy, page, limit)
+        movies_data, total = await db.get_all_movies(genre, sortBy, page, limit, minRuntime, maxRuntime)
         
         # Convert MongoDB documents to Movie objects
-        movies = []
-        for movie_data in movies_data:
-            # Remove MongoDB _id field
-            if '_id' in movie_data:
-                del movie_data['_id']
-            movies.append(Movie(**movie_data))
+        movies = await convert_movies(movies_data)
         
         total_pages = math.ceil(total / limit)
         
@@ -67,27 +317,103 @@ async def get_movies(
         logging.error(f"Error getting movies: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Home page sections in one response; section queries run concurrently and
+# fail independently (a failed section is reported under "errors")
+@api_router.get("/home")
+async def get_home(
+    featured: int = Query(10, ge=0, le=50, description="Featured movies to return (0 to skip)"),
+    topRated: int = Query(10, ge=0, le=100, description="Top rated movies to return (0 to skip)"),
+    popular: int = Query(6, ge=0, le=100, description="Popular movies to return (0 to skip)"),
+    genres: bool = Query(True, description="Include the genre list"),
+    db: MovieDatabase = Depends(get_movie_db)
+):
+    sections = {}
+    if featured:
+        sections["featured"] = db.get_featured_movies(featured)
+    if topRated:
+        sections["top_rated"] = db.get_top_rated_movies(topRated)
+    if popular:
+        sections["popular"] = db.get_popular_movies(popular)
+    if genres:
+        sections["genres"] = db.get_all_genres()
+
+    results = await asyncio.gather(*sections.values(), return_exceptions=True)
+
+    response = {"errors": {}}
+    for name, result in zip(sections, results):
+        if isinstance(result, Exception):
+            logging.error(f"Error getting home section {name}: {str(result)}")
+            response["errors"][name] = str(result)
+        elif name == "genres":
+            response[name] = result
+        else:
+            response[name] = await convert_movies(result)
+    return response
+
 # Search movies (must be before /movies/{movie_id})
 @api_router.get("/movies/search")
 async def search_movies(
     q: str = Query(..., min_length=1, description="Search query"),
+    limit: int = Query(20, ge=1, le=100, description="Results per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    highlight: bool = Query(False, description="Include match offsets per field"),
     db: MovieDatabase = Depends(get_movie_db)
 ):
+    page = decode_search_cursor(cursor, q) if cursor else None
     try:
-        movies_data = await db.search_movies(q)
-        
-        # Convert MongoDB documents to Movie objects
-        movies = []
-        for movie_data in movies_data:
-            if '_id' in movie_data:
-                del movie_data['_id']
-            movies.append(Movie(**movie_data))
-        
-        return {"movies": movies, "total": len(movies)}
+        if page is None:
+            # The only full match: rank every candidate up to the cap, which
+            # also gives the total, and store them for the later pages
+            keys = await db.search_candidates(q, SEARCH_COUNT_CAP)
+            total, total_is_estimate = min(len(keys), SEARCH_COUNT_CAP), len(keys) > SEARCH_COUNT_CAP
+            stored = keys[:SEARCH_COUNT_CAP]
+            results = await db.save_search_results(q, stored) if len(keys) > limit else None
+            page_keys, offset, stored_count = stored[:limit], 0, len(stored)
+            has_more = len(keys) > limit
+        else:
+            total, total_is_estimate = page["total"], page["estimate"]
+            results, stored_count, offset = page["results"], page["stored"], page["offset"]
+            page_keys = None
+            if results:
+                page_keys = await db.load_search_results(results, offset, limit, SEARCH_RESULT_TTL)
+            if page_keys:
+                # Past the stored results, an estimated total means more follow
+                has_more = offset + len(page_keys) < stored_count or total_is_estimate
+            else:
+                # Stored results expired, or ran out at the cap: seek past the
+                # last key returned, matching again
+                results = None
+                seek_movies, has_more = await db.search_movies(q, limit, after=tuple(page["after"]))
+                page_keys = [{"id": m["id"], "score": m["score"], "rank": m["rank"]} for m in seek_movies]
+        movies_data = await db.get_movies_by_ids([key["id"] for key in page_keys])
+
+        next_cursor = None
+        if has_more and page_keys:
+            next_cursor = encode_search_cursor(q, page_keys[-1], total, total_is_estimate,
+                                               results=results, stored=stored_count,
+                                               offset=offset + len(page_keys))
+
+        result = {
+            "movies": await convert_movies(movies_data),
+            "total": total,
+            "total_is_estimate": total_is_estimate,
+            "next_cursor": next_cursor
+        }
+        if highlight:
+            result["highlights"] = {m["id"]: search_highlights(m, q) for m in movies_data}
+        return result
     except Exception as e:
         logging.error(f"Error searching movies: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Typeahead suggestions from the in-memory index (must be before /movies/{movie_id})
+@api_router.get("/movies/suggest")
+async def suggest_movies(
+    prefix: str = Query(..., min_length=1, max_length=100, description="Typed prefix"),
+    limit: int = Query(8, ge=1, le=suggest_index.top_k, description="Number of suggestions")
+):
+    return {"suggestions": suggest_index.suggest(prefix, limit)}
+
 # Get featured movies (must be before /movies/{movie_id})
 @api_router.get("/movies/featured")
 async def get_featured_movies(
@@ -97,11 +423,7 @@ async def get_featured_movies(
         movies_data = await db.get_featured_movies()
         
         # Convert MongoDB documents to Movie objects
-        movies = []
-        for movie_data in movies_data:
-            if '_id' in movie_data:
-                del movie_data['_id']
-            movies.append(Movie(**movie_data))
+        movies = await convert_movies(movies_data)
         
         return {"movies": movies}
     except Exception as e:
@@ -118,11 +440,7 @@ async def get_top_rated_movies(
         movies_data = await db.get_top_rated_movies(limit)
         
         # Convert MongoDB documents to Movie objects
-        movies = []
-        for movie_data in movies_data:
-            if '_id' in movie_data:
-                del movie_data['_id']
-            movies.append(Movie(**movie_data))
+        movies = await convert_movies(movies_data)
         
         return {"movies": movies}
     except Exception as e:
@@ -133,6 +451,7 @@ async def get_top_rated_movies(
 @api_router.get("/movies/{movie_id}")
 async def get_movie(
     movie_id: str,
+    response: Response,
     db: MovieDatabase = Depends(get_movie_db)
 ):
     try:
@@ -144,6 +463,7 @@ async def get_movie(
         if '_id' in movie_data:
             del movie_data['_id']
         
+        response.headers["ETag"] = movie_etag(movie_data)
         return Movie(**movie_data)
     except HTTPException:
         raise
@@ -151,6 +471,81 @@ async def get_movie(
         logging.error(f"Error getting movie {movie_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Update movie (partial); If-Match guards against lost updates
+@api_router.patch("/movies/{movie_id}")
+async def update_movie(
+    movie_id: str,
+    movie_update: MovieUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    write_mode: Optional[str] = Query(None, pattern="^(wait|async)$",
+                                      description="Batch the write: wait for the flush, or return once queued"),
+    db: MovieDatabase = Depends(get_movie_db)
+):
+    update_data = movie_update.dict(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    if write_mode and if_match is not None:
+        raise HTTPException(status_code=400, detail="If-Match is not supported with write_mode")
+
+    try:
+        if write_mode:
+            await write_queue.submit_update(movie_id, update_data, wait=write_mode == "wait")
+            status = "written" if write_mode == "wait" else "queued"
+            return JSONResponse(status_code=200 if status == "written" else 202,
+                                content={"id": movie_id, "status": status})
+
+        updated_movie = await db.update_movie(movie_id, update_data, parse_if_match(if_match))
+        if not updated_movie:
+            raise HTTPException(status_code=404, detail="Movie not found")
+
+        if '_id' in updated_movie:
+            del updated_movie['_id']
+
+        response.headers["ETag"] = movie_etag(updated_movie)
+        return Movie(**updated_movie)
+    except PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Movie was modified by another request")
+    except MovieNotFound:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    except WriteBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error updating movie {movie_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Delete movie; If-Match guards against deleting a newer version
+@api_router.delete("/movies/{movie_id}")
+async def delete_movie(
+    movie_id: str,
+    if_match: Optional[str] = Header(None),
+    db: MovieDatabase = Depends(get_movie_db)
+):
+    try:
+        deleted = await db.delete_movie(movie_id, parse_if_match(if_match))
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Movie not found")
+
+        return {"message": f"Movie {movie_id} deleted"}
+    except PreconditionFailed:
+        raise HTTPException(status_code=412, detail="Movie was modified by another request")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error deleting movie {movie_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Rate a movie; votes are buffered and applied in periodic batches
+@api_router.post("/movies/{movie_id}/ratings", status_code=202)
+async def rate_movie(movie_id: str, rating: RatingCreate):
+    try:
+        rating_ingest.submit(movie_id, rating.score)
+    except RatingBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return {"message": "Rating accepted"}
+
 # Get movies by genre
 @api_router.get("/movies/genre/{genre}")
 async def get_movies_by_genre(
@@ -161,11 +556,7 @@ async def get_movies_by_genre(
         movies_data = await db.get_movies_by_genre(genre)
         
         # Convert MongoDB documents to Movie objects
-        movies = []
-        for movie_data in movies_data:
-            if '_id' in movie_data:
-                del movie_data['_id']
-            movies.append(Movie(**movie_data))
+        movies = await convert_movies(movies_data)
         
         return {"movies": movies}
     except Exception as e:
@@ -176,20 +567,154 @@ async def get_movies_by_genre(
 @api_router.post("/movies")
 async def create_movie(
     movie: MovieCreate,
+    write_mode: Optional[str] = Query(None, pattern="^(wait|async)$",
+                                      description="Batch the write: wait for the flush, or return once queued"),
     db: MovieDatabase = Depends(get_movie_db)
 ):
     try:
         movie_data = movie.dict()
+        if write_mode:
+            movie_id = await write_queue.submit_insert(movie_data, wait=write_mode == "wait")
+            status = "written" if write_mode == "wait" else "queued"
+            return JSONResponse(status_code=201 if status == "written" else 202,
+                                content={"id": movie_id, "status": status})
+
         created_movie = await db.create_movie(movie_data)
         
         if '_id' in created_movie:
             del created_movie['_id']
         
         return Movie(**created_movie)
+    except WriteBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logging.error(f"Error creating movie: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Live movie updates as Server-Sent Events
+@api_router.get("/events/movies")
+async def stream_movie_events():
+    queue = change_feed.subscribe()
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment frame keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event)
+        finally:
+            change_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Catalog-wide rating stats
+@api_router.get("/stats")
+async def get_stats_overview():
+    try:
+        return await stats_rollups.get_overview()
+    except Exception as e:
+        logging.error(f"Error getting stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Rebuild rating rollups from the movies collection
+@api_router.post("/stats/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_stats():
+    try:
+        groups = await stats_rollups.rebuild()
+        return {"message": f"Rebuilt {groups} stats groups"}
+    except Exception as e:
+        logging.error(f"Error rebuilding stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Rating stats grouped by year, decade or genre
+@api_router.get("/stats/{dimension}")
+async def get_stats_by_dimension(dimension: str):
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown stats dimension: {dimension}")
+    try:
+        return {"dimension": dimension, "groups": await stats_rollups.get_dimension(dimension)}
+    except Exception as e:
+        logging.error(f"Error getting stats by {dimension}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Runtime metrics
+@api_router.get("/metrics")
+async def get_metrics():
+    return {
+        "admission": admission.snapshot(),
+        "change_feed": change_feed.snapshot(),
+        "slow_queries": slow_query_log.snapshot(),
+        "write_behind": write_queue.snapshot(),
+        "ratings": rating_ingest.snapshot(),
+        "stats": stats_rollups.snapshot(),
+        "tracing": tracer.exporter.snapshot() if tracer else None,
+        "loop_lag": loop_monitor.snapshot(),
+        "cpu_offload": cpu_offload.snapshot()
+    }
+
+# Recent slow queries (admin)
+@api_router.get("/admin/slow-queries", dependencies=[Depends(require_admin)])
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=200, description="Number of entries to return")
+):
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "queries": slow_query_log.recent(limit)
+    }
+
+# Recent request profiles (admin)
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def get_profiles(
+    limit: int = Query(20, ge=1, le=100, description="Number of profiles to return")
+):
+    if profiler is None:
+        return {"enabled": False, "profiles": []}
+    return {"enabled": True, "profiles": profiler.recent(limit)}
+
+# Download a profile in pstats format (admin)
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    path = profiler.profile_path(profile_id) if profiler else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+# Schema migration status (admin)
+@api_router.get("/admin/migrations", dependencies=[Depends(require_admin)])
+async def get_migrations():
+    try:
+        return await migration_runner.status()
+    except Exception as e:
+        logging.error(f"Error getting migration status: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Start pending schema migrations in the background (admin)
+@api_router.post("/admin/migrations/run", status_code=202, dependencies=[Depends(require_admin)])
+async def start_migrations():
+    run_in_background(run_migrations())
+    return {"message": "Migrations started", "target_version": CURRENT_SCHEMA_VERSION}
+
+# Recent event loop stalls with the blocking stack (admin)
+@api_router.get("/admin/loop-stalls", dependencies=[Depends(require_admin)])
+async def get_loop_stalls(
+    limit: int = Query(20, ge=1, le=50, description="Number of stalls to return")
+):
+    return {
+        "threshold_ms": loop_monitor.threshold_ms,
+        "stalls": loop_monitor.recent_stalls(limit)
+    }
+
 # Get all genres
 @api_router.get("/genres")
 async def get_genres(
@@ -217,6 +742,12 @@ async def seed_database(
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(AdmissionMiddleware, controller=admission)
+if profiler is not None:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+if tracer is not None:
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -232,12 +763,135 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Startup event
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def build_indexes():
+    readiness.update("indexes", status="running", progress=0.0)
+    try:
+        built = await movie_db.create_indexes(
+            on_progress=lambda done, total: readiness.update("indexes", progress=done / total)
+        )
+        await movie_db.ensure_search_results_ttl(SEARCH_RESULT_TTL)
+        readiness.ready("indexes", detail=f"{built} index(es) built")
+        logger.info(f"Database indexes ready ({built} built)")
+    except Exception as e:
+        logger.error(f"Error building indexes: {str(e)}")
+        readiness.failed("indexes", str(e))
+
+async def build_stats():
+    readiness.update("stats", status="running")
+    try:
+        if await stats_rollups.is_empty():
+            await stats_rollups.rebuild()
+        readiness.ready("stats")
+    except Exception as e:
+        logger.error(f"Error building stats rollups: {str(e)}")
+        readiness.failed("stats", str(e))
+
+async def build_suggest_index():
+    global suggest_replay
+    if suggest_replay is not None:
+        return
+    readiness.update("suggest", status="running")
+    suggest_replay = []
+    try:
+        movies = await movie_db.get_movies_for_index(SUGGEST_FIELDS)
+        fresh = await cpu_offload.run(suggest_index.build, movies)
+        for op, movie_id, movie in suggest_replay:
+            if op == "delete":
+                fresh.remove(movie_id)
+            elif op != "reset" and movie is not None:
+                fresh.upsert(movie)
+        suggest_index.replace_with(fresh)
+        readiness.ready("suggest", detail=f"{len(suggest_index)} movies indexed")
+    except Exception as e:
+        logger.error(f"Error building suggest index: {str(e)}")
+        readiness.failed("suggest", str(e))
+    finally:
+        suggest_replay = None
+
+async def sync_rating_sort() -> bool:
+    """Sort by weighted_rating once every movie has it; True when it does"""
+    if await migration_runner.completed_version() >= WEIGHTED_RATING_VERSION:
+        movie_db.rating_field = "weighted_rating"
+        return True
+    return False
+
+async def run_migrations():
+    readiness.update("migrations", status="running")
+    try:
+        version = await migration_runner.run()
+        if version < 0:
+            readiness.ready("migrations", detail="running in another worker")
+            # Pick up weighted_rating sorting when the other worker finishes
+            while not await sync_rating_sort():
+                await asyncio.sleep(30)
+        else:
+            readiness.ready("migrations", detail=f"schema version {version}")
+            await sync_rating_sort()
+    except Exception as e:
+        logger.error(f"Error running migrations: {str(e)}")
+        readiness.failed("migrations", str(e))
+
+async def wait_for_database(initial_delay: float = 1.0, max_delay: float = 30.0):
+    """Ping until Mongo answers, backing off between attempts; a worker that
+    started while Mongo was down becomes ready once it is back"""
+    readiness.update("database", status="running")
+    delay = initial_delay
+    attempt = 1
+    while True:
+        try:
+            await movie_db.db.command("ping")
+            readiness.ready("database")
+            return
+        except Exception as e:
+            logger.error(f"Database not reachable during warm-up (attempt {attempt}): {str(e)}")
+            readiness.update("database", detail=f"Attempt {attempt} failed, retrying in {delay:g}s: {str(e)}")
+        await asyncio.sleep(delay)
+        delay = min(max_delay, delay * 2)
+        attempt += 1
+
+async def warm_up():
+    await wait_for_database(max_delay=float(os.environ.get('WARM_UP_MAX_BACKOFF', '30')))
+    await build_indexes()
+    try:
+        await sync_rating_sort()
+    except Exception as e:
+        logger.error(f"Error reading schema version: {str(e)}")
+    if os.environ.get('MIGRATIONS_AUTO_RUN', 'true').lower() == 'true':
+        run_in_background(run_migrations())
+    await build_stats()
+    await build_suggest_index()
+
+# Startup event: serve immediately, warm up in the background
 @app.on_event("startup")
 async def startup_event():
-    await movie_db.create_indexes()
-    logger.info("Database indexes created")
+    loop_monitor.start()
+    run_in_background(warm_up())
+    change_feed.start()
+    admission.start()
+    write_queue.start()
+    rating_ingest.start()
+    stats_rollups.start()
+    if tracer is not None:
+        tracer.exporter.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in list(background_tasks):
+        task.cancel()
+    await write_queue.stop()
+    await rating_ingest.stop()
+    # After the queues above, whose flushes produce stats deltas
+    await stats_rollups.stop()
+    if tracer is not None:
+        await tracer.exporter.stop()
+    await admission.stop()
+    await change_feed.stop()
+    await loop_monitor.stop()
+    cpu_offload.shutdown()
     movie_db.client.close()
\ No newline at end of file
@@ -0,0 +1,264 @@
+from pymongo import UpdateOne, ReplaceOne
+from typing import Dict, List, Optional
+from datetime import datetime
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ("year", "decade", "genre")
+HISTOGRAM_BUCKETS = 10
+
+
+def rating_bucket(rating: float) -> int:
+    """Histogram bucket for a rating: [0, 1) -> 0, ..., [9, 10] -> 9"""
+    return min(HISTOGRAM_BUCKETS - 1, max(0, int(math.floor(rating))))
+
+
+def has_stats_fields(movie: dict) -> bool:
+    """Whether a movie has the numeric rating and year the rollups need"""
+    return all(isinstance(movie.get(field), (int, float)) and not isinstance(movie.get(field), bool)
+               for field in ("rating", "year"))
+
+
+# Aggregation filter matching has_stats_fields
+STATS_FIELDS_FILTER = {"rating": {"$type": "number"}, "year": {"$type": "number"}}
+
+
+def movie_groups(movie: dict) -> List[str]:
+    """Rollup group ids a movie contributes to"""
+    year = movie["year"]
+    groups = ["all:all", f"year:{year}", f"decade:{year // 10 * 10}"]
+    groups += [f"genre:{genre}" for genre in movie.get("genre", [])]
+    return groups
+
+
+def _empty_histogram() -> Dict[str, int]:
+    return {str(bucket): 0 for bucket in range(HISTOGRAM_BUCKETS)}
+
+
+class StatsRollups:
+    """Rating rollups by year, decade and genre kept in the ``movie_stats`` collection.
+
+    Each group document stores ``count``, ``rating_sum`` and a rating histogram.
+    Writes produce ``$inc`` deltas for the groups a movie enters or leaves, so
+    reads cost O(groups); ``rebuild`` recomputes everything with one
+    aggregation when the rollups may have drifted. Movies without a numeric
+    rating and year are left out and counted in ``snapshot``.
+
+    Deltas are merged in memory and written every ``flush_interval`` as one
+    unordered ``bulk_write``, off the request path, so a write costs no extra
+    round trip and a write-behind batch becomes one stats write. Deltas still
+    buffered when the process dies are lost until the next ``rebuild``.
+    """
+
+    def __init__(self, movie_db, flush_interval: float = 1.0):
+        self.movies = movie_db.movies
+        self.stats = movie_db.db.movie_stats
+        self.flush_interval = flush_interval
+        # group id -> {"count", "rating_sum", "histogram"} not yet written
+        self._pending: Dict[str, dict] = {}
+        # Flushes and rebuilds must not interleave, or a rebuild could be
+        # overwritten by deltas it already counted
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self.skipped_writes = 0
+        self.skipped_on_rebuild = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms: Optional[float] = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let an in-flight flush finish, then flush what is left"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def apply(self, op: str, movie_id: str, before: Optional[dict], after: Optional[dict]):
+        """Write listener: move a movie's contribution from ``before`` to ``after``"""
+        deltas = self._pending
+
+        def add(movie: dict, sign: int):
+            if not has_stats_fields(movie):
+                self.skipped_writes += 1
+                return
+            bucket = str(rating_bucket(movie["rating"]))
+            for group in movie_groups(movie):
+                delta = deltas.setdefault(group, {"count": 0, "rating_sum": 0.0, "histogram": {}})
+                delta["count"] += sign
+                delta["rating_sum"] += sign * movie["rating"]
+                delta["histogram"][bucket] = delta["histogram"].get(bucket, 0) + sign
+
+        if before is not None:
+            add(before, -1)
+        if after is not None:
+            add(after, 1)
+
+    def _merge(self, deltas: Dict[str, dict]):
+        for group, delta in deltas.items():
+            pending = self._pending.setdefault(group, {"count": 0, "rating_sum": 0.0, "histogram": {}})
+            pending["count"] += delta["count"]
+            pending["rating_sum"] += delta["rating_sum"]
+            for bucket, n in delta["histogram"].items():
+                pending["histogram"][bucket] = pending["histogram"].get(bucket, 0) + n
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            deltas, self._pending = self._pending, {}
+            started = time.perf_counter()
+            self.flushes += 1
+            try:
+                await self._write(deltas)
+            except asyncio.CancelledError:
+                self._merge(deltas)
+                raise
+            except Exception as e:
+                # Unordered writes may have partly applied; retrying the lot
+                # is the lesser drift, and rebuild corrects either way
+                self._merge(deltas)
+                self.failed_flushes += 1
+                logger.error(f"Stats flush failed, {len(deltas)} groups requeued: {str(e)}")
+                return
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    async def _write(self, deltas: Dict[str, dict]):
+        operations = []
+        for group, delta in deltas.items():
+            inc = {f"histogram.{bucket}": n for bucket, n in delta["histogram"].items() if n}
+            if delta["count"]:
+                inc["count"] = delta["count"]
+            if delta["rating_sum"]:
+                inc["rating_sum"] = delta["rating_sum"]
+            if not inc:
+                continue
+            dimension, key = group.split(":", 1)
+            operations.append(UpdateOne(
+                {"_id": group},
+                {"$inc": inc, "$set": {"dimension": dimension, "key": key}},
+                upsert=True
+            ))
+
+        if operations:
+            await self.stats.bulk_write(operations, ordered=False)
+
+    async def rebuild(self) -> int:
+        """Recompute every rollup from the movies collection"""
+        async with self._lock:
+            # Buffered deltas are for writes the aggregation already sees
+            self._pending = {}
+            return await self._rebuild()
+
+    async def _rebuild(self) -> int:
+        pipeline = [
+            {"$match": STATS_FIELDS_FILTER},
+            {"$project": {
+                "genre": 1,
+                "rating": 1,
+                "year": 1,
+                "decade": {"$multiply": [{"$floor": {"$divide": ["$year", 10]}}, 10]},
+                "bucket": {"$min": [HISTOGRAM_BUCKETS - 1, {"$floor": "$rating"}]},
+            }},
+            {"$facet": {
+                "all": [self._group_stage({"$literal": "all"})],
+                "year": [self._group_stage("$year")],
+                "decade": [self._group_stage("$decade")],
+                "genre": [{"$unwind": "$genre"}, self._group_stage("$genre")],
+            }},
+        ]
+
+        groups: Dict[str, dict] = {}
+        async for facets in self.movies.aggregate(pipeline):
+            for dimension, rows in facets.items():
+                for row in rows:
+                    key = str(int(row["_id"]["key"])) if dimension in ("year", "decade") else row["_id"]["key"]
+                    group = groups.setdefault(f"{dimension}:{key}", {
+                        "dimension": dimension,
+                        "key": key,
+                        "count": 0,
+                        "rating_sum": 0.0,
+                        "histogram": _empty_histogram(),
+                    })
+                    group["count"] += row["count"]
+                    group["rating_sum"] += row["rating_sum"]
+                    group["histogram"][str(int(row["_id"]["bucket"]))] += row["count"]
+
+        rebuilt_at = datetime.utcnow()
+        operations = [
+            ReplaceOne({"_id": group_id}, {**group, "rebuilt_at": rebuilt_at}, upsert=True)
+            for group_id, group in groups.items()
+        ]
+        if operations:
+            await self.stats.bulk_write(operations, ordered=False)
+        await self.stats.delete_many({"_id": {"$nin": list(groups)}})
+
+        self.skipped_on_rebuild = await self.movies.count_documents({"$nor": [STATS_FIELDS_FILTER]})
+        if self.skipped_on_rebuild:
+            logger.warning(f"Stats rebuild skipped {self.skipped_on_rebuild} movie(s) without a numeric rating and year")
+        logger.info(f"Rebuilt {len(groups)} stats rollups")
+        return len(groups)
+
+    @staticmethod
+    def _group_stage(key) -> dict:
+        return {"$group": {
+            "_id": {"key": key, "bucket": "$bucket"},
+            "count": {"$sum": 1},
+            "rating_sum": {"$sum": "$rating"},
+        }}
+
+    def snapshot(self) -> dict:
+        return {
+            "skipped_writes": self.skipped_writes,
+            "skipped_on_rebuild": self.skipped_on_rebuild,
+            "pending_groups": len(self._pending),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+    async def is_empty(self) -> bool:
+        return await self.stats.find_one({}) is None
+
+    async def get_overview(self) -> dict:
+        return self._format(await self.stats.find_one({"_id": "all:all"}))
+
+    async def get_dimension(self, dimension: str) -> List[dict]:
+        cursor = self.stats.find({"dimension": dimension, "count": {"$gt": 0}})
+        groups = [self._format(doc) async for doc in cursor]
+        if dimension in ("year", "decade"):
+            groups.sort(key=lambda group: int(group["key"]))
+        else:
+            groups.sort(key=lambda group: group["key"])
+        return groups
+
+    @staticmethod
+    def _format(doc: Optional[dict]) -> dict:
+        if not doc or not doc.get("count"):
+            return {"key": doc["key"] if doc else "all", "count": 0, "average_rating": None,
+                    "histogram": _empty_histogram()}
+        histogram = _empty_histogram()
+        histogram.update({k: v for k, v in doc.get("histogram", {}).items()})
+        return {
+            "key": doc["key"],
+            "count": doc["count"],
+            "average_rating": round(doc["rating_sum"] / doc["count"], 3),
+            "histogram": histogram,
+        }
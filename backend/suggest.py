@@ -0,0 +1,211 @@
+from typing import Dict, Iterable, List, Optional
+import re
+import unicodedata
+
+# Rank of the field a suggestion matched on, used to break rating ties
+FIELD_RANK = {"title": 0, "director": 1, "cast": 2}
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation/whitespace to single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", stripped.lower()).strip()
+
+
+def _word_suffixes(text: str) -> List[str]:
+    """'the dark knight' -> ['the dark knight', 'dark knight', 'knight']"""
+    words = text.split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class _Node:
+    __slots__ = ("children", "terminals", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # movie_id -> rank of the best field whose key ends at this node
+        self.terminals: Dict[str, int] = {}
+        # Best entries of the whole subtree: (-rating, field_rank, title, movie_id)
+        self.top: List[tuple] = []
+
+
+class SuggestIndex:
+    """In-memory prefix trie over normalized titles, directors and cast names.
+
+    Every word-boundary suffix of each name is a key, so "knight" reaches
+    "The Dark Knight". Each node stores the top-K movies of its subtree by
+    rating, so a lookup is a walk of ``len(prefix)`` nodes plus a slice. Keys
+    are indexed up to ``max_depth`` characters; longer prefixes are answered
+    from the node at that depth and filtered against the full keys.
+    """
+
+    def __init__(self, top_k: int = 10, max_depth: int = 24):
+        self.top_k = top_k
+        self.max_depth = max_depth
+        self.root = _Node()
+        self.movies: Dict[str, dict] = {}
+
+    def __len__(self):
+        return len(self.movies)
+
+    def _keys(self, movie: dict) -> Dict[str, int]:
+        keys: Dict[str, int] = {}
+        names = [(movie.get("title", ""), "title"), (movie.get("director", ""), "director")]
+        names += [(name, "cast") for name in movie.get("cast", [])]
+        for name, field in names:
+            for key in _word_suffixes(normalize(name)):
+                rank = FIELD_RANK[field]
+                if key not in keys or rank < keys[key]:
+                    keys[key] = rank
+        return keys
+
+    def _path(self, key: str, create: bool = False) -> List[_Node]:
+        node = self.root
+        path = [node]
+        for char in key[:self.max_depth]:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return path
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def build(self, movies: Iterable[dict]) -> "SuggestIndex":
+        """Build a new index with the same settings; touches no shared state,
+        so it can run off the event loop"""
+        fresh = SuggestIndex(self.top_k, self.max_depth)
+        for movie in movies:
+            fresh.upsert(movie)
+        return fresh
+
+    def replace_with(self, fresh: "SuggestIndex"):
+        self.root, self.movies = fresh.root, fresh.movies
+
+    def rebuild(self, movies: Iterable[dict]):
+        """Replace the whole index, e.g. on warm-up or after a missed change"""
+        self.replace_with(self.build(movies))
+
+    def upsert(self, movie: dict):
+        movie_id = movie["id"]
+        if movie_id in self.movies:
+            self.remove(movie_id)
+
+        keys = self._keys(movie)
+        self.movies[movie_id] = {
+            "summary": {
+                "id": movie_id,
+                "title": movie.get("title"),
+                "year": movie.get("year"),
+                "rating": movie.get("rating"),
+                "poster": movie.get("poster"),
+            },
+            "keys": keys,
+        }
+
+        sort_key = -(movie.get("rating") or 0.0)
+        title = normalize(movie.get("title", ""))
+        for key, rank in keys.items():
+            path = self._path(key, create=True)
+            path[-1].terminals[movie_id] = min(rank, path[-1].terminals.get(movie_id, rank))
+            entry = (sort_key, rank, title, movie_id)
+            for node in path:
+                self._offer(node, entry)
+
+    def _offer(self, node: _Node, entry: tuple):
+        for index, existing in enumerate(node.top):
+            if existing[3] == entry[3]:
+                if entry < existing:
+                    node.top[index] = entry
+                    node.top.sort()
+                return
+        if len(node.top) < self.top_k or entry < node.top[-1]:
+            node.top.append(entry)
+            node.top.sort()
+            del node.top[self.top_k:]
+
+    def remove(self, movie_id: str):
+        indexed = self.movies.pop(movie_id, None)
+        if indexed is None:
+            return
+
+        # Drop the terminals first, then refill affected nodes deepest-first so
+        # every child's top list is already correct when its parent is rebuilt
+        affected = {}
+        for key in indexed["keys"]:
+            path = self._path(key)
+            path[-1].terminals.pop(movie_id, None)
+            for depth, node in enumerate(path):
+                if any(entry[3] == movie_id for entry in node.top):
+                    affected[id(node)] = (depth, node)
+
+        for _, node in sorted(affected.values(), key=lambda item: -item[0]):
+            self._refill(node)
+
+        for key in indexed["keys"]:
+            self._prune(key)
+
+    def _refill(self, node: _Node):
+        candidates = {}
+        for movie_id, rank in node.terminals.items():
+            summary = self.movies[movie_id]["summary"]
+            candidates[movie_id] = (-(summary["rating"] or 0.0), rank, normalize(summary["title"] or ""), movie_id)
+        for child in node.children.values():
+            for entry in child.top:
+                if entry[3] not in candidates or entry < candidates[entry[3]]:
+                    candidates[entry[3]] = entry
+        node.top = sorted(candidates.values())[:self.top_k]
+
+    def _prune(self, key: str):
+        path = self._path(key)
+        chars = key[:len(path) - 1]
+        for depth in range(len(path) - 1, 0, -1):
+            node = path[depth]
+            if node.children or node.terminals:
+                break
+            del path[depth - 1].children[chars[depth - 1]]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[dict]:
+        query = normalize(prefix)
+        if not query:
+            return []
+        path = self._path(query)
+        if len(path) - 1 < min(len(query), self.max_depth):
+            return []
+
+        results = []
+        for _, rank, _, movie_id in path[-1].top:
+            indexed = self.movies[movie_id]
+            if len(query) > self.max_depth and not any(k.startswith(query) for k in indexed["keys"]):
+                continue
+            results.append({**indexed["summary"], "matched": _field_name(rank)})
+            if len(results) >= limit:
+                break
+        return results
+
+    def apply_event(self, event: dict) -> Optional[str]:
+        """Apply a change feed event; returns 'reset' if the index must be rebuilt"""
+        op = event["op"]
+        if op == "reset":
+            return "reset"
+        if op == "delete":
+            # A delete the feed could not map back to a movie id leaves no way
+            # to find the stale entries short of rebuilding
+            if not event.get("id"):
+                return "reset"
+            self.remove(event["id"])
+            return None
+        if event.get("movie") is not None:
+            self.upsert(event["movie"])
+        return None
+
+
+def _field_name(rank: int) -> str:
+    for field, field_rank in FIELD_RANK.items():
+        if field_rank == rank:
+            return field
+    return "title"
@@ -0,0 +1,308 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+
+from fastapi.routing import APIRoute
+
+from query_log import redact
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+# Root span of the request being handled, so the route can mark when its
+# handler returned
+_request_span: ContextVar[Optional["Span"]] = ContextVar("request_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns",
+                 "attributes", "status", "tracer", "handler_end_ns")
+
+    def __init__(self, tracer: "Tracer", trace_id: str, parent_id: Optional[str], name: str,
+                 start_ns: Optional[int] = None, attributes: Optional[dict] = None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.handler_end_ns: Optional[int] = None
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+        self.tracer.exporter.add(self)
+
+    def child(self, name: str, start_ns: Optional[int] = None, **attributes) -> "Span":
+        return Span(self.tracer, self.trace_id, self.span_id, name, start_ns, attributes)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """Run a block as a child of the current span; a no-op outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    span = parent.child(name, **attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.status = "error"
+        span.attributes["error"] = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+class SpanExporter:
+    """Buffer finished spans and ship them in batches from a background task.
+
+    Spans go to a JSON-lines file and/or an OTLP/HTTP JSON endpoint
+    (``/v1/traces``). The buffer is bounded; spans are dropped, never awaited
+    on, when the exporter falls behind.
+    """
+
+    def __init__(self, service_name: str, file_path: Optional[str] = None,
+                 otlp_endpoint: Optional[str] = None, flush_interval: float = 1.0,
+                 max_buffer: int = 10000):
+        self.service_name = service_name
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max_buffer)
+        self._task: Optional[asyncio.Task] = None
+        self.exported = 0
+        self.dropped = 0
+
+    def add(self, span: Span):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(span)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        spans = []
+        while self._buffer:
+            spans.append(self._buffer.popleft())
+        if not spans:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._export, spans)
+            self.exported += len(spans)
+        except Exception as e:
+            self.dropped += len(spans)
+            logger.error(f"Error exporting {len(spans)} spans: {str(e)}")
+
+    def _export(self, spans: List[Span]):
+        if self.file_path:
+            with open(self.file_path, "a") as f:
+                for span in spans:
+                    f.write(json.dumps(span.to_dict(), default=str) + "\n")
+        if self.otlp_endpoint:
+            import requests
+            response = requests.post(self.otlp_endpoint, json=self._otlp_payload(spans), timeout=5)
+            response.raise_for_status()
+
+    def _otlp_payload(self, spans: List[Span]) -> dict:
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            if not isinstance(value, str):
+                value = json.dumps(value, default=str)
+            return {"key": key, "value": {"stringValue": value}}
+
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "imdb-clone"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 2 if span.parent_id is None else 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+                    "status": {"code": 2 if span.status == "error" else 1},
+                } for span in spans],
+            }],
+        }]}
+
+    def snapshot(self) -> dict:
+        return {"buffered": len(self._buffer), "exported": self.exported, "dropped": self.dropped}
+
+
+class Tracer:
+    def __init__(self, exporter: SpanExporter, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes) -> Optional[Span]:
+        """Root span for an incoming request, continuing the caller's trace if given"""
+        match = _TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            if not int(flags, 16) & 1:
+                return None
+        else:
+            if random.random() >= self.sample_rate:
+                return None
+            trace_id, parent_id = os.urandom(16).hex(), None
+        return Span(self, trace_id, parent_id, name, attributes=attributes)
+
+    def observe_query(self, op: str, spec: dict, started_at: float, duration_ms: float,
+                      returned: Optional[int]):
+        """MovieDatabase query observer recording each query as a child span"""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        start_ns = int(started_at * 1e9)
+        span = parent.child(
+            f"db.{op}",
+            start_ns=start_ns,
+            **{"db.collection": spec.get("collection", "movies"), "db.returned": returned},
+        )
+        if "filter" in spec:
+            span.attributes["db.filter"] = redact(spec["filter"])
+        if spec.get("sort"):
+            span.attributes["db.sort"] = spec["sort"]
+        span.end(start_ns + int(duration_ms * 1e6))
+
+
+class TracedRoute(APIRoute):
+    """APIRoute whose endpoint runs inside a ``handler`` span.
+
+    The span ends when the endpoint returns, before FastAPI validates and
+    encodes the response; TracingMiddleware attributes that remainder to a
+    ``response.encode`` span.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        endpoint = self.dependant.call
+        name = f"handler {self.path}"
+
+        path = self.path
+
+        async def traced_endpoint(*call_args, **call_kwargs):
+            with trace_span(name):
+                try:
+                    return await endpoint(*call_args, **call_kwargs)
+                finally:
+                    root = _request_span.get()
+                    if root is not None:
+                        root.attributes["http.route"] = path
+                        root.handler_end_ns = time.time_ns()
+
+        # Sync endpoints run in a threadpool; FastAPI decides that from the
+        # original callable, so only coroutine endpoints are wrapped
+        if asyncio.iscoroutinefunction(endpoint):
+            self.dependant.call = traced_endpoint
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a root span per request and propagating
+    ``traceparent`` in and out"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        traceparent = headers.get(b"traceparent")
+        root = self.tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent.decode("latin-1") if traceparent else None,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                if message["status"] >= 500:
+                    root.status = "error"
+                if root.handler_end_ns is not None:
+                    root.child("response.encode", start_ns=root.handler_end_ns).end()
+                message.setdefault("headers", []).append((b"traceparent", root.traceparent.encode()))
+            await send(message)
+
+        token = _current_span.set(root)
+        root_token = _request_span.set(root)
+        try:
+            await self.app(scope, receive, traced_send)
+        except Exception as e:
+            root.status = "error"
+            root.attributes["error"] = str(e)
+            raise
+        finally:
+            _request_span.reset(root_token)
+            _current_span.reset(token)
+            root.end()
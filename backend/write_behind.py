@@ -0,0 +1,262 @@
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import List, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBacklogFull(Exception):
+    """Raised when the write-behind queue cannot accept more writes"""
+
+
+class MovieNotFound(Exception):
+    """Raised to a waiting caller whose update matched no movie"""
+
+
+class _PendingWrite:
+    __slots__ = ("kind", "movie_id", "document", "future")
+
+    def __init__(self, kind: str, movie_id: str, document: dict, future: Optional[asyncio.Future]):
+        self.kind = kind
+        self.movie_id = movie_id
+        self.document = document
+        self.future = future
+
+
+class WriteBehindQueue:
+    """Batch movie creates and updates into periodic ``bulk_write`` calls.
+
+    Writes are accepted into an in-memory queue and flushed every
+    ``flush_interval_ms`` or as soon as ``max_batch`` are waiting. Callers
+    choose durability per write: ``wait=True`` resolves once the batch holding
+    the write is acknowledged, ``wait=False`` returns as soon as it is queued
+    (and is lost if the process dies before the flush).
+
+    A batch is written as unordered ``bulk_write`` rounds, each holding at
+    most one write per movie, so a failing write only fails its own caller
+    while writes to the same movie still apply in the order they were made.
+    """
+
+    def __init__(self, movie_db, flush_interval_ms: float = 5.0, max_batch: int = 100,
+                 max_backlog: int = 10000):
+        self.movie_db = movie_db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_backlog = max_backlog
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        # Every write flushed, failed or not
+        self.batched = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush whatever is queued, then stop the flusher"""
+        if self._task is None:
+            return
+        # The sentinel lands behind every queued write, so they all get flushed
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def submit_insert(self, movie_data: dict, wait: bool = False) -> str:
+        document = self.movie_db.prepare_new_movie(movie_data)
+        await self._submit(_PendingWrite("insert", document["id"], document, None), wait)
+        return document["id"]
+
+    async def submit_update(self, movie_id: str, update_data: dict, wait: bool = False) -> str:
+        self.movie_db.prepare_update(update_data)
+        await self._submit(_PendingWrite("update", movie_id, update_data, None), wait)
+        return movie_id
+
+    async def _submit(self, pending: _PendingWrite, wait: bool):
+        if self._queue.qsize() >= self.max_backlog:
+            raise WriteBacklogFull(f"Write backlog is full ({self.max_backlog} pending)")
+        if wait:
+            pending.future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(pending)
+        if wait:
+            await pending.future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            pending = await self._queue.get()
+            if pending is None:
+                break
+            batch = [pending]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Keep the flusher alive and never leave a caller waiting on
+                # a batch that will not be retried
+                logger.error(f"Write-behind flush of {len(batch)} writes crashed: {str(e)}")
+                for pending in batch:
+                    if pending.future is not None and not pending.future.done():
+                        pending.future.set_exception(e)
+
+    async def _flush(self, batch: List[_PendingWrite]):
+        if not batch:
+            return
+        movies = self.movie_db.movies
+        started = time.perf_counter()
+
+        # Round n holds the n-th write to each movie
+        rounds: List[List[int]] = []
+        seen = {}
+        for index, pending in enumerate(batch):
+            depth = seen.get(pending.movie_id, 0)
+            seen[pending.movie_id] = depth + 1
+            if depth == len(rounds):
+                rounds.append([])
+            rounds[depth].append(index)
+
+        errors = {}
+        current = {}
+        update_ids = list({p.movie_id for p in batch if p.kind == "update"})
+        try:
+            # One read per batch gives write listeners the pre-images of
+            # updates, and shows which updates have no movie to apply to
+            if update_ids:
+                async for movie in movies.find({"id": {"$in": update_ids}}):
+                    current[movie["id"]] = movie
+        except Exception as e:
+            for index in range(len(batch)):
+                errors[index] = e
+            rounds = []
+
+        exists = set(current)
+        # Movie id -> error of its first failed write
+        failed = {}
+        for indexes in rounds:
+            round_indexes = []
+            for index in indexes:
+                pending = batch[index]
+                if pending.movie_id in failed:
+                    # An earlier write to this movie failed; keep the order by
+                    # not applying the later ones
+                    errors[index] = failed[pending.movie_id]
+                elif pending.kind == "update" and pending.movie_id not in exists:
+                    errors[index] = failed[pending.movie_id] = MovieNotFound(f"Movie {pending.movie_id} not found")
+                else:
+                    round_indexes.append(index)
+            if not round_indexes:
+                continue
+
+            operations = [
+                InsertOne(batch[i].document) if batch[i].kind == "insert"
+                else UpdateOne({"id": batch[i].movie_id}, self.movie_db.update_document(batch[i].document))
+                for i in round_indexes
+            ]
+            round_updates = sum(1 for i in round_indexes if batch[i].kind == "update")
+            try:
+                result = await movies.bulk_write(operations, ordered=False)
+                matched = result.matched_count
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    index = round_indexes[write_error["index"]]
+                    errors[index] = failed[batch[index].movie_id] = BulkWriteError({"writeErrors": [write_error]})
+                matched = e.details.get("nMatched", round_updates)
+            except Exception as e:
+                for index in round_indexes:
+                    errors[index] = failed[batch[index].movie_id] = e
+                continue
+
+            for index in round_indexes:
+                if batch[index].kind == "insert" and index not in errors:
+                    exists.add(batch[index].movie_id)
+            if matched < round_updates:
+                # A movie was deleted after the pre-image read
+                await self._fail_missing(batch, round_indexes, errors, failed, exists)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        applied = len(batch) - len(errors)
+        self.batches += 1
+        self.batched += len(batch)
+        self.written += applied
+        self.failed += len(errors)
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        if errors:
+            logger.error(f"Write-behind flush failed {len(errors)}/{len(batch)} writes: "
+                         f"{str(next(iter(errors.values())))}")
+
+        for index, pending in enumerate(batch):
+            error = errors.get(index)
+            if error is None:
+                await self._notify(pending, current)
+                if pending.future is not None and not pending.future.done():
+                    pending.future.set_result(pending.movie_id)
+            elif pending.future is not None and not pending.future.done():
+                pending.future.set_exception(error)
+
+    async def _fail_missing(self, batch: List[_PendingWrite], round_indexes: List[int],
+                            errors: dict, failed: dict, exists: set):
+        update_ids = [batch[i].movie_id for i in round_indexes
+                      if batch[i].kind == "update" and i not in errors]
+        try:
+            found = {movie["id"] async for movie in self.movie_db.movies.find({"id": {"$in": update_ids}}, {"id": 1})}
+        except Exception as e:
+            # Which of these applied is unknown; report the error rather
+            # than a success that may not have happened
+            for index in round_indexes:
+                if batch[index].kind == "update" and index not in errors:
+                    errors[index] = failed[batch[index].movie_id] = e
+            return
+        for index in round_indexes:
+            pending = batch[index]
+            if pending.kind == "update" and index not in errors and pending.movie_id not in found:
+                errors[index] = failed[pending.movie_id] = MovieNotFound(f"Movie {pending.movie_id} not found")
+                exists.discard(pending.movie_id)
+
+    async def _notify(self, pending: _PendingWrite, current: dict):
+        if pending.kind == "insert":
+            current[pending.movie_id] = pending.document
+            await self.movie_db.notify_write("insert", pending.movie_id, None, pending.document)
+            return
+        before = current.get(pending.movie_id)
+        if before is None:
+            return
+        after = self.movie_db.apply_update(before, pending.document)
+        current[pending.movie_id] = after
+        await self.movie_db.notify_write("update", pending.movie_id, before, after)
+
+    def snapshot(self) -> dict:
+        return {
+            "backlog": self._queue.qsize(),
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "last_batch_size": self.last_batch_size,
+            "avg_batch_size": round(self.batched / self.batches, 2) if self.batches else 0,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 2) if self.batches else 0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
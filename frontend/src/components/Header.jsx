@@ -1,13 +1,42 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { Search, Menu, Star } from 'lucide-react';
 import { Link, useNavigate } from 'react-router-dom';
 import { Input } from './ui/input';
+import { moviesApi } from '../services/api';
 
 const Header = () => {
   const [searchQuery, setSearchQuery] = useState('');
   const [isMenuOpen, setIsMenuOpen] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
   const navigate = useNavigate();
 
+  useEffect(() => {
+    const prefix = searchQuery.trim();
+    if (!prefix) {
+      setSuggestions([]);
+      return;
+    }
+
+    // Ignore responses for prefixes the user has already typed past
+    let current = true;
+    moviesApi.suggestMovies(prefix)
+      .then((response) => {
+        if (current) setSuggestions(response.suggestions || []);
+      })
+      .catch(() => {
+        if (current) setSuggestions([]);
+      });
+    return () => {
+      current = false;
+    };
+  }, [searchQuery]);
+
+  const handleSuggestionClick = (movie) => {
+    navigate(`/movie/${movie.id}`);
+    setSearchQuery('');
+    setSuggestions([]);
+  };
+
   const handleSearch = (e) => {
     e.preventDefault();
     if (searchQuery.trim()) {
@@ -55,6 +84,22 @@ const Header = () => {
                 className="w-64 pl-10 pr-4 py-2 bg-gray-800 border-gray-600 text-white placeholder-gray-400 focus:border-yellow-400"
               />
               <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400 w-4 h-4" />
+              {suggestions.length > 0 && (
+                <ul className="absolute left-0 right-0 mt-1 bg-gray-800 border border-gray-600 rounded-md shadow-lg overflow-hidden">
+                  {suggestions.map((movie) => (
+                    <li key={movie.id}>
+                      <button
+                        type="button"
+                        onClick={() => handleSuggestionClick(movie)}
+                        className="w-full text-left px-3 py-2 hover:bg-gray-700 transition-colors"
+                      >
+                        <span className="text-white">{movie.title}</span>
+                        <span className="text-gray-400 text-sm ml-2">({movie.year})</span>
+                      </button>
+                    </li>
+                  ))}
+                </ul>
+              )}
             </div>
           </form>
 
@@ -1,5 +1,5 @@
-import { useState, useEffect } from 'react';
-import { moviesApi } from '../services/api';
+import { useState, useEffect, useRef } from 'react';
+import { moviesApi, subscribeToMovieEvents } from '../services/api';
 
 export const useMovies = (params = {}) => {
   const [movies, setMovies] = useState([]);
@@ -11,8 +11,11 @@ export const useMovies = (params = {}) => {
     per_page: 20,
     total_pages: 0
   });
+  // Params of the last fetch, so a feed reset reloads the same page
+  const lastParams = useRef({});
 
   const fetchMovies = async (customParams = {}) => {
+    lastParams.current = customParams;
     try {
       setLoading(true);
       setError(null);
@@ -38,6 +41,20 @@ export const useMovies = (params = {}) => {
     fetchMovies();
   }, []);
 
+  // Keep the listed movies current from the live feed. Inserts are left for
+  // the next fetch, since where a new movie lands depends on the sort and page
+  useEffect(() => {
+    return subscribeToMovieEvents((event) => {
+      if (event.op === 'update' || event.op === 'replace') {
+        setMovies(prev => prev.map(movie => (movie.id === event.id ? { ...movie, ...event.movie } : movie)));
+      } else if (event.op === 'delete') {
+        setMovies(prev => prev.filter(movie => movie.id !== event.id));
+      } else if (event.op === 'reset') {
+        fetchMovies(lastParams.current);
+      }
+    });
+  }, []);
+
   const refetch = (newParams = {}) => {
     fetchMovies(newParams);
   };
@@ -107,6 +124,35 @@ export const useFeaturedMovies = () => {
   return { featuredMovies, loading, error };
 };
 
+export const useHome = (sizes = {}) => {
+  const [sections, setSections] = useState({});
+  const [errors, setErrors] = useState({});
+  const [loading, setLoading] = useState(true);
+
+  const fetchHome = async () => {
+    try {
+      setLoading(true);
+      setErrors({});
+
+      const response = await moviesApi.getHome(sizes);
+      const { errors: sectionErrors, ...rest } = response;
+      setSections(rest);
+      setErrors(sectionErrors || {});
+    } catch (err) {
+      setSections({});
+      setErrors({ request: err.message });
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  useEffect(() => {
+    fetchHome();
+  }, []);
+
+  return { sections, errors, loading, refetch: fetchHome };
+};
+
 export const useTopRatedMovies = (limit = 20) => {
   const [topRatedMovies, setTopRatedMovies] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -136,28 +182,58 @@ export const useTopRatedMovies = (limit = 20) => {
 
 export const useMovieSearch = () => {
   const [searchResults, setSearchResults] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [totalIsEstimate, setTotalIsEstimate] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [lastQuery, setLastQuery] = useState('');
   const [loading, setLoading] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
 
   const searchMovies = async (query) => {
     if (!query.trim()) {
       setSearchResults([]);
+      setTotal(0);
+      setNextCursor(null);
       return;
     }
 
     try {
       setLoading(true);
       setError(null);
+      setLastQuery(query);
       
       const response = await moviesApi.searchMovies(query);
       setSearchResults(response.movies || []);
+      setTotal(response.total || 0);
+      setTotalIsEstimate(Boolean(response.total_is_estimate));
+      setNextCursor(response.next_cursor || null);
     } catch (err) {
       setError(err.message);
       setSearchResults([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
   };
 
-  return { searchResults, loading, error, searchMovies };
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+
+    try {
+      setLoadingMore(true);
+      const response = await moviesApi.searchMovies(lastQuery, { cursor: nextCursor });
+      setSearchResults(prev => [...prev, ...(response.movies || [])]);
+      setNextCursor(response.next_cursor || null);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  return {
+    searchResults, total, totalIsEstimate, hasMore: Boolean(nextCursor),
+    loading, loadingMore, error, searchMovies, loadMore
+  };
 };
\ No newline at end of file
@@ -5,12 +5,18 @@ import HeroSection from '../components/HeroSection';
 import MovieCard from '../components/MovieCard';
 import LoadingSpinner from '../components/LoadingSpinner';
 import ErrorMessage from '../components/ErrorMessage';
-import { useFeaturedMovies, useMovies } from '../hooks/useMovies';
+import { useHome } from '../hooks/useMovies';
 import { Button } from '../components/ui/button';
 
 const Home = () => {
-  const { featuredMovies, loading: featuredLoading, error: featuredError } = useFeaturedMovies();
-  const { movies: popularMovies, loading: popularLoading, error: popularError, refetch } = useMovies({ limit: 6 });
+  // One request for every section; each section can still fail on its own
+  const { sections, errors, loading, refetch } = useHome({ featured: 10, popular: 6, topRated: 0, genres: false });
+  const featuredMovies = sections.featured || [];
+  const popularMovies = sections.popular || [];
+  const featuredLoading = loading;
+  const popularLoading = loading;
+  const featuredError = errors.featured || errors.request;
+  const popularError = errors.popular || errors.request;
   
   const heroMovie = featuredMovies.length > 0 ? featuredMovies[0] : null;
 
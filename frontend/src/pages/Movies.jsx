@@ -90,6 +90,7 @@ const Movies = () => {
                   <SelectItem value="rating" className="text-white hover:bg-gray-600">Rating</SelectItem>
                   <SelectItem value="year" className="text-white hover:bg-gray-600">Year</SelectItem>
                   <SelectItem value="title" className="text-white hover:bg-gray-600">Title</SelectItem>
+                  <SelectItem value="runtime" className="text-white hover:bg-gray-600">Runtime</SelectItem>
                 </SelectContent>
               </Select>
             </div>
@@ -5,11 +5,14 @@ import MovieCard from '../components/MovieCard';
 import LoadingSpinner from '../components/LoadingSpinner';
 import ErrorMessage from '../components/ErrorMessage';
 import { useMovieSearch } from '../hooks/useMovies';
+import { Button } from '../components/ui/button';
 
 const SearchResults = () => {
   const [searchParams] = useSearchParams();
   const query = searchParams.get('q') || '';
-  const { searchResults, loading, error, searchMovies } = useMovieSearch();
+  const {
+    searchResults, total, totalIsEstimate, hasMore, loading, loadingMore, error, searchMovies, loadMore
+  } = useMovieSearch();
 
   useEffect(() => {
     if (query) {
@@ -45,7 +48,7 @@ const SearchResults = () => {
         {/* Results Count */}
         <div className="mb-6">
           <p className="text-gray-400">
-            Found {searchResults.length} movie{searchResults.length !== 1 ? 's' : ''}
+            Found {total}{totalIsEstimate ? '+' : ''} movie{total !== 1 ? 's' : ''}
           </p>
         </div>
         
@@ -77,6 +80,19 @@ const SearchResults = () => {
             </p>
           </div>
         )}
+
+        {/* Load More */}
+        {hasMore && (
+          <div className="text-center mt-8">
+            <Button
+              onClick={loadMore}
+              disabled={loadingMore}
+              variant="outline"
+            >
+              {loadingMore ? 'Loading...' : 'Load More'}
+            </Button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -36,6 +36,16 @@ apiClient.interceptors.response.use(
 
 // Movie API functions
 export const moviesApi = {
+  // Get all home page sections in one request; sizes are per-section limits (0 skips a section)
+  getHome: async (sizes = {}) => {
+    try {
+      const response = await apiClient.get('/home', { params: sizes });
+      return response.data;
+    } catch (error) {
+      throw new Error(error.response?.data?.detail || 'Failed to fetch home page');
+    }
+  },
+
   // Get all movies with filtering and pagination
   getMovies: async (params = {}) => {
     try {
@@ -59,18 +69,31 @@ export const moviesApi = {
     }
   },
 
-  // Search movies
-  searchMovies: async (query) => {
+  // Search movies; pass the previous page's next_cursor to fetch the next page
+  searchMovies: async (query, { limit = 20, cursor = null } = {}) => {
     try {
-      const response = await apiClient.get('/movies/search', {
-        params: { q: query }
-      });
+      const params = { q: query, limit };
+      if (cursor) params.cursor = cursor;
+
+      const response = await apiClient.get('/movies/search', { params });
       return response.data;
     } catch (error) {
       throw new Error(error.response?.data?.detail || 'Failed to search movies');
     }
   },
 
+  // Typeahead suggestions for a search prefix (served from memory, cheap per keystroke)
+  suggestMovies: async (prefix, limit = 8) => {
+    try {
+      const response = await apiClient.get('/movies/suggest', {
+        params: { prefix, limit }
+      });
+      return response.data;
+    } catch (error) {
+      throw new Error(error.response?.data?.detail || 'Failed to fetch suggestions');
+    }
+  },
+
   // Get featured movies
   getFeaturedMovies: async () => {
     try {
@@ -111,6 +134,46 @@ export const moviesApi = {
     } catch (error) {
       throw new Error(error.response?.data?.detail || 'Failed to create movie');
     }
+  },
+
+  // Update movie fields; pass the ETag from a previous read to avoid lost updates
+  updateMovie: async (id, changes, etag) => {
+    try {
+      const response = await apiClient.patch(`/movies/${id}`, changes, {
+        headers: etag ? { 'If-Match': etag } : {}
+      });
+      return { movie: response.data, etag: response.headers.etag };
+    } catch (error) {
+      if (error.response?.status === 412) {
+        throw new Error('Movie was changed by someone else, reload and try again');
+      }
+      throw new Error(error.response?.data?.detail || 'Failed to update movie');
+    }
+  },
+
+  // Delete movie
+  deleteMovie: async (id, etag) => {
+    try {
+      const response = await apiClient.delete(`/movies/${id}`, {
+        headers: etag ? { 'If-Match': etag } : {}
+      });
+      return response.data;
+    } catch (error) {
+      if (error.response?.status === 412) {
+        throw new Error('Movie was changed by someone else, reload and try again');
+      }
+      throw new Error(error.response?.data?.detail || 'Failed to delete movie');
+    }
+  },
+
+  // Rate a movie from 1 to 10; the vote is applied asynchronously
+  rateMovie: async (id, score) => {
+    try {
+      const response = await apiClient.post(`/movies/${id}/ratings`, { score });
+      return response.data;
+    } catch (error) {
+      throw new Error(error.response?.data?.detail || 'Failed to submit rating');
+    }
   }
 };
 
@@ -127,6 +190,17 @@ export const genresApi = {
   }
 };
 
+// Live movie updates pushed by the backend (Server-Sent Events)
+export const subscribeToMovieEvents = (onEvent) => {
+  const source = new EventSource(`${API}/events/movies`);
+  ['insert', 'update', 'replace', 'delete', 'reset'].forEach((op) => {
+    source.addEventListener(op, (event) => {
+      onEvent(JSON.parse(event.data));
+    });
+  });
+  return () => source.close();
+};
+
 // Utility functions
 export const handleApiError = (error) => {
   if (error.response) {
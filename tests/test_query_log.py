@@ -0,0 +1,20 @@
+from query_log import redact
+
+
+def test_redact_replaces_literals_and_keeps_operators():
+    assert redact({"genre": "Drama", "rating": {"$gte": 8}}) == {"genre": "?", "rating": {"$gte": "?"}}
+
+
+def test_redact_collapses_lists_to_distinct_shapes():
+    spec = {"$or": [{"title": {"$regex": "dark"}}, {"title": {"$regex": "night"}}, {"director": {"$regex": "x"}}]}
+
+    assert redact(spec) == {"$or": [{"title": {"$regex": "?"}}, {"director": {"$regex": "?"}}]}
+    assert redact({"id": {"$in": ["1", "2", "3"]}}) == {"id": {"$in": ["?"]}}
+
+
+def test_redact_handles_pipelines_and_scalars():
+    pipeline = [{"$match": {"featured": True}}, {"$limit": 10}]
+
+    assert redact(pipeline) == [{"$match": {"featured": "?"}}, {"$limit": "?"}]
+    assert redact(None) == "?"
+    assert redact([]) == []
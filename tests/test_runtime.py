@@ -0,0 +1,41 @@
+import pytest
+
+from models import Movie, MovieCreate, parse_runtime_minutes
+
+
+@pytest.mark.parametrize("duration, minutes", [
+    ("142 min", 142),
+    ("142", 142),
+    ("2h 22m", 142),
+    ("2h22m", 142),
+    ("2h30", 150),
+    ("2 hours 30", 150),
+    ("1h 5", 65),
+    ("2h", 120),
+    ("45m", 45),
+    ("2 HR 10 MIN", 130),
+])
+def test_parse_runtime_minutes(duration, minutes):
+    assert parse_runtime_minutes(duration) == minutes
+
+
+@pytest.mark.parametrize("duration", [None, "", "unknown", "TBA"])
+def test_parse_runtime_minutes_unparseable(duration):
+    assert parse_runtime_minutes(duration) is None
+
+
+MOVIE = {
+    "title": "Heat", "year": 1995, "rating": 8.3, "genre": ["Crime"], "director": "Michael Mann",
+    "duration": "2h50", "poster": "p", "backdrop": "b", "plot": "A heist crew and a detective.",
+    "cast": ["Al Pacino"],
+}
+
+
+def test_runtime_minutes_is_derived_not_accepted():
+    assert "runtime_minutes" not in MovieCreate.model_fields
+    assert Movie(**MOVIE).runtime_minutes == 170
+    assert Movie(**MOVIE, runtime_minutes=5).runtime_minutes == 170
+
+
+def test_runtime_minutes_kept_when_duration_is_unparseable():
+    assert Movie(**dict(MOVIE, duration="TBA"), runtime_minutes=90).runtime_minutes == 90
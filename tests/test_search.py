@@ -0,0 +1,67 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from server import decode_search_cursor, encode_search_cursor, search_highlights
+
+LAST = {"id": "42", "score": 3, "rank": 8.7}
+
+
+def test_cursor_round_trip():
+    cursor = encode_search_cursor("dark", LAST, 57, False, results="abc", stored=57, offset=20)
+
+    page = decode_search_cursor(cursor, "dark")
+
+    assert page["after"] == [3, 8.7, "42"]
+    assert (page["total"], page["estimate"]) == (57, False)
+    assert (page["results"], page["stored"], page["offset"]) == ("abc", 57, 20)
+
+
+def test_cursor_without_stored_results_defaults():
+    page = decode_search_cursor(encode_search_cursor("dark", LAST, 1000, True), "dark")
+
+    assert (page["results"], page["stored"], page["offset"]) == (None, 0, 0)
+    assert page["estimate"] is True
+
+
+def encode(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 at all!",
+    encode(["a", "list"]),
+    encode({"q": "dark", "after": [3, "42"], "total": 1, "estimate": False, "offset": 0}),
+    encode({"q": "dark", "after": [3, 8.7, "42"], "total": 1, "estimate": False, "offset": -5}),
+    encode({"q": "dark", "after": [3, 8.7, "42"], "total": 1, "estimate": False, "offset": "5"}),
+    encode({"q": "dark", "after": [3, 8.7, "42"], "total": 1, "estimate": False}),
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_search_cursor(cursor, "dark")
+    assert raised.value.status_code == 400
+
+
+def test_cursor_for_another_query_is_rejected():
+    cursor = encode_search_cursor("dark", LAST, 57, False)
+
+    with pytest.raises(HTTPException) as raised:
+        decode_search_cursor(cursor, "light")
+    assert raised.value.status_code == 400
+
+
+def test_highlights_cover_every_case_insensitive_match():
+    movie = {"title": "Dark Dark Night", "director": "Christopher Nolan", "genre": ["Action", "Drama"]}
+
+    assert search_highlights(movie, "dark") == {"title": [[0, 4], [5, 9]]}
+    assert search_highlights(movie, "DRA") == {"genre.1": [[0, 3]]}
+    assert search_highlights(movie, "o") == {"director": [[6, 7], [13, 14]], "genre.0": [[4, 5]]}
+
+
+def test_highlights_treat_the_query_literally():
+    movie = {"title": "Who? (1974)", "director": None, "genre": []}
+
+    assert search_highlights(movie, "(19") == {"title": [[5, 8]]}
+    assert search_highlights(movie, ".") == {}
@@ -0,0 +1,91 @@
+from suggest import SuggestIndex
+
+
+def movie(movie_id, title, rating, director="Someone", cast=()):
+    return {"id": movie_id, "title": title, "rating": rating, "director": director, "cast": list(cast)}
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_suggest_orders_by_rating_and_matches_word_suffixes():
+    index = SuggestIndex()
+    index.upsert(movie("1", "The Dark Knight", 9.0))
+    index.upsert(movie("2", "Dark City", 7.6))
+    index.upsert(movie("3", "Knight and Day", 6.3))
+
+    assert ids(index.suggest("dark")) == ["1", "2"]
+    assert ids(index.suggest("kni")) == ["1", "3"]
+    assert index.suggest("kni")[0]["matched"] == "title"
+
+
+def test_suggest_normalizes_accents_and_punctuation():
+    index = SuggestIndex()
+    index.upsert(movie("1", "Amélie", 8.3))
+    index.upsert(movie("2", "Spider-Man", 7.4))
+
+    assert ids(index.suggest("AME")) == ["1"]
+    assert ids(index.suggest("spider man")) == ["2"]
+
+
+def test_upsert_replaces_previous_keys_and_rating():
+    index = SuggestIndex()
+    index.upsert(movie("1", "Alien", 8.5))
+    index.upsert(movie("2", "Aliens", 8.4))
+
+    index.upsert(movie("1", "Prometheus", 7.0))
+
+    assert ids(index.suggest("alien")) == ["2"]
+    assert ids(index.suggest("prom")) == ["1"]
+    assert index.suggest("prom")[0]["rating"] == 7.0
+    assert len(index) == 2
+
+
+def test_matched_field_prefers_title_over_cast():
+    index = SuggestIndex()
+    index.upsert(movie("1", "Heat", 8.3, director="Michael Mann", cast=["Al Pacino"]))
+
+    assert index.suggest("mann")[0]["matched"] == "director"
+    assert index.suggest("pacino")[0]["matched"] == "cast"
+
+
+def test_remove_refills_top_k_from_the_rest_of_the_subtree():
+    index = SuggestIndex(top_k=2)
+    index.upsert(movie("1", "Star Wars", 8.6))
+    index.upsert(movie("2", "Stardust", 7.6))
+    index.upsert(movie("3", "Star Trek", 7.9))
+    index.upsert(movie("4", "Starship Troopers", 7.2))
+
+    assert ids(index.suggest("star")) == ["1", "3"]
+
+    index.remove("1")
+    assert ids(index.suggest("star")) == ["3", "2"]
+
+    index.remove("3")
+    assert ids(index.suggest("star")) == ["2", "4"]
+
+
+def test_remove_prunes_empty_branches():
+    index = SuggestIndex()
+    index.upsert(movie("1", "Zodiac", 7.7, director="D", cast=[]))
+
+    index.remove("1")
+
+    assert index.suggest("zod") == []
+    assert "z" not in index.root.children
+    assert len(index) == 0
+
+
+def test_refill_keeps_the_best_entry_per_movie():
+    index = SuggestIndex(top_k=3)
+    index.upsert(movie("1", "Rocky", 8.1, director="John Avildsen", cast=["Rocky Balboa"]))
+    index.upsert(movie("2", "Rocketman", 7.3))
+
+    node = index._path("roc")[-1]
+    node.top = []
+    index._refill(node)
+
+    assert [entry[3] for entry in node.top] == ["1", "2"]
+    # "rocky" is both a title and a cast key; the title rank wins
+    assert node.top[0][1] == 0